@@ -0,0 +1,192 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+##
+## Headless export for build scripts, run as
+##
+##   fontedit export --format arm_c font.fnt font.c
+##   fontedit export --format arm_c --output-dir build/ a.fnt b.fnt ...
+##
+## Nothing in here may import gi, the whole point is that it runs on
+## machines without a display or GTK installed.
+##
+## Outputs are cached (see export_cache.py) so re-running an export on an
+## unchanged font leaves the output file, and its timestamp, alone.
+##
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from fontfile import load_font
+from export_cache import ExportCache, DEFAULT_LIMIT
+from exporter_registry import default_registry
+
+def find_exporter(name):
+  """ Import and return the exporters dict for the exporter called name,
+      either the module name (e.g. arm_c) or the name it shows in the
+      export dialog. """
+  return default_registry().find(name).load()
+
+def export_file(exporter, src, dst, cache_dir=None, cache_limit=None,
+                options=None):
+  """ Export one font file, runs in a worker process so everything it needs
+      is looked up again here.  options are passed to the exporter as
+      keyword arguments.  Returns (src, dst, error, seconds, hit, report)
+      where error is None on success, hit is True if the output came from
+      the cache and report is the exporter's summary of the output, if it
+      gave one. """
+  start = time.perf_counter()
+  hit = False
+  try:
+    found = default_registry().find(exporter)
+    details = found.load()
+    font = load_font(src)
+    reason = found.supports(font)
+    if reason is not None:
+      raise ValueError(reason)
+    if cache_dir is None:
+      ret = details['func'](font, dst, **(options or {}))
+    else:
+      cache = ExportCache(cache_dir, cache_limit)
+      ret = cache.export(details, font, dst, options)
+      hit = cache.hits > 0
+  except Exception as e:
+    ret = "%s: %s" % (type(e).__name__, e)
+  err = ret if isinstance(ret, str) else None
+  report = ret.get("report") if isinstance(ret, dict) else None
+  return (src, dst, err, time.perf_counter() - start, hit, report)
+
+def output_name(src, output_dir, suffix):
+  return os.path.join(output_dir,
+                      os.path.splitext(os.path.basename(src))[0] + suffix)
+
+def parse_args(argv):
+  parser = argparse.ArgumentParser(prog="fontedit export",
+              description="Export fonts without starting the editor.")
+  parser.add_argument("--format", "-f", required=True,
+              help="exporter to use, module name or display name")
+  parser.add_argument("--output-dir", "-o",
+              help="export every input into this directory, all the "
+                   "positional arguments are then input fonts")
+  parser.add_argument("--suffix", default=".c",
+              help="extension for files written with --output-dir "
+                   "(default %(default)s)")
+  parser.add_argument("--option", action="append", default=[],
+              metavar="NAME=VALUE",
+              help="pass an option to the exporter, e.g. layouts=rows,pages "
+                   "for c_layouts.  May be given more than once")
+  parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count(),
+              help="number of worker processes (default %(default)s)")
+  parser.add_argument("--no-cache", action="store_true",
+              help="always run the exporter")
+  parser.add_argument("--cache-dir",
+              help="where to keep cached output (default "
+                   "$FONTEDIT_CACHE_DIR or ~/.cache/fontedit/exports)")
+  parser.add_argument("--cache-size", type=float,
+              default=DEFAULT_LIMIT / (1024 * 1024),
+              help="cache size limit in MiB (default %(default)s)")
+  parser.add_argument("--quiet", "-q", action="store_true",
+              help="only report errors")
+  parser.add_argument("files", nargs="+", metavar="FILE")
+  args = parser.parse_args(argv)
+
+  args.options = {}
+  for opt in args.option:
+    name, sep, value = opt.partition("=")
+    if not sep or not name:
+      parser.error("--option needs NAME=VALUE, not %r" % opt)
+    args.options[name] = value
+
+  if args.output_dir is None:
+    if len(args.files) != 2:
+      parser.error("give an input and output file, or use --output-dir "
+                   "to export several fonts")
+    args.jobs_list = [(args.files[0], args.files[1])]
+  else:
+    os.makedirs(args.output_dir, exist_ok=True)
+    args.jobs_list = [(f, output_name(f, args.output_dir, args.suffix))
+                      for f in args.files]
+  return args
+
+def main(argv, started=None):
+  """ Entry point for fontedit export, returns the process exit code """
+  if started is None:
+    started = time.perf_counter()
+  args = parse_args(argv)
+
+  try:
+    find_exporter(args.format)
+  except LookupError as e:
+    print(e, file=sys.stderr)
+    return 2
+  except Exception as e:
+    print("%s: %s: %s" % (args.format, type(e).__name__, e), file=sys.stderr)
+    return 2
+
+  cache = None
+  if not args.no_cache:
+    cache = ExportCache(args.cache_dir, int(args.cache_size * 1024 * 1024))
+
+  ready = time.perf_counter()
+  jobs = args.jobs_list
+  workers = max(1, min(args.jobs or 1, len(jobs)))
+  extra = [[cache and cache.directory] * len(jobs),
+           [cache and cache.limit] * len(jobs),
+           [args.options] * len(jobs)]
+
+  if workers == 1:
+    results = list(map(export_file, [args.format] * len(jobs),
+                       [src for src, dst in jobs],
+                       [dst for src, dst in jobs], *extra))
+  else:
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+      results = list(pool.map(export_file, [args.format] * len(jobs),
+                              [src for src, dst in jobs],
+                              [dst for src, dst in jobs], *extra))
+  done = time.perf_counter()
+
+  failed = 0
+  for src, dst, err, seconds, hit, report in results:
+    if err is not None:
+      failed += 1
+      print("%s: %s" % (src, err), file=sys.stderr)
+    elif not args.quiet:
+      print("%s -> %s  %.1f ms%s" % (src, dst, seconds * 1000,
+                                     " (cached)" if hit else ""),
+            file=sys.stderr)
+      if report:
+        print("%s: %s" % (dst, report))
+
+  if cache is not None:
+    cache.hits = sum(1 for r in results if r[4])
+    cache.misses = len(results) - cache.hits
+    cache.evict()
+    if not args.quiet:
+      print(cache.report(), file=sys.stderr)
+
+  if not args.quiet:
+    total = done - ready
+    print("startup %.1f ms, %d font(s) in %.3f s with %d worker(s), "
+          "%.1f fonts/s" % ((ready - started) * 1000, len(jobs), total,
+                            workers, len(jobs) / total if total else 0.0),
+          file=sys.stderr)
+
+  return 1 if failed else 0
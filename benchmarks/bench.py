@@ -0,0 +1,378 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Benchmarks for the parts of fontedit that get slow on big fonts.
+##
+##   python3 benchmarks/bench.py run -o results.json
+##   python3 benchmarks/bench.py run --sizes 96x8x8 --only export
+##   python3 benchmarks/bench.py compare base.json results.json --threshold 10
+##
+## Fonts are synthetic, filled with seeded random pixels so every run sees
+## the same data.  Sizes are given as CHARSxROWSxCOLS.  Each benchmark is
+## run --repeat times and the minimum and median kept.
+##
+## compare exits with status 1 if any benchmark got slower than the
+## threshold (percent), so it can gate a CI job.  Timings below --min-time
+## are too noisy to judge and are only reported.
+##
+## The GTK benchmarks need a display.  Without one they try GTK's broadway
+## backend (if a broadwayd is running) and are otherwise recorded as
+## skipped rather than failing the run.
+##
+
+import argparse
+import json
+import os
+import pickle
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+from internal_font_class import Font
+from fontfile import load_font, save_font
+from exporter_registry import default_registry
+from render import render_text
+
+DEFAULT_SIZES = ("96x8x8", "256x16x16", "65535x32x32")
+
+def parse_size(text):
+  chars, rows, cols = (int(v) for v in text.lower().split("x"))
+  return chars, rows, cols
+
+def make_font(chars, rows, cols, seed=1):
+  """ A font with every character filled with random pixels """
+  rng = random.Random(seed)
+  font = Font(rows, cols, chars)
+  font.load_glyphs((i, [rng.getrandbits(cols) for j in range(rows)])
+                   for i in range(chars))
+  return font
+
+def timed(func, repeat):
+  """ Run func repeat times, returns the list of times in seconds.  func
+      may return a function to run untimed after each run to tidy up. """
+  times = []
+  for k in range(repeat):
+    start = time.perf_counter()
+    tidy = func()
+    times.append(time.perf_counter() - start)
+    if callable(tidy):
+      tidy()
+  return times
+
+## the benchmarks, each is called with (font, size, tmp) and returns a
+## function to time
+
+def bench_font_init(font, size, tmp):
+  chars, rows, cols = size
+  return lambda: Font(rows, cols, chars)
+
+def bench_set_character(font, size, tmp):
+  # a few hundred characters as lists of pixel lists, as the editor does
+  rng = random.Random(2)
+  count = min(font.chars, 256)
+  pixels = [[[rng.getrandbits(1) for x in range(font.cols)]
+             for y in range(font.rows)] for i in range(count + 1)]
+  runs = [0]
+  def run():
+    # a different character each time so every call really changes one
+    runs[0] += 1
+    for i in range(count):
+      font.set_character(i, pixels[(i + runs[0]) % (count + 1)])
+  return run
+
+def bench_set_packed(font, size, tmp):
+  rng = random.Random(3)
+  count = min(font.chars, 4096)
+  rows = [[rng.getrandbits(font.cols) for y in range(font.rows)]
+          for i in range(count + 1)]
+  runs = [0]
+  def run():
+    runs[0] += 1
+    for i in range(count):
+      font.set_packed(i, rows[(i + runs[0]) % (count + 1)])
+  return run
+
+def bench_save(font, size, tmp):
+  filename = os.path.join(tmp, "bench.fnt")
+  def run():
+    # a full save, not an incremental one
+    font._saved = None
+    save_font(font, filename)
+  return run
+
+def bench_load(font, size, tmp):
+  filename = os.path.join(tmp, "bench.fnt")
+  save_font(font, filename)
+  def run():
+    loaded = load_font(filename)
+    # touch every character so lazily mapped data is really read
+    for i, rows in loaded.glyphs():
+      pass
+  return run
+
+def bench_pickle_load(font, size, tmp):
+  # fonts from before the binary file format
+  data = pickle.dumps(font)
+  return lambda: pickle.loads(data)
+
+def bench_render(font, size, tmp):
+  # a screen full of text, 1920 pixels wide
+  chars = [chr(c) for c in range(32, min(font.chars, 127))] or ["\0"]
+  per_line = max(1, 1920 // font.cols)
+  lines = max(1, 1080 // font.rows)
+  text = "\n".join("".join(chars[(k + n) % len(chars)]
+                           for k in range(per_line)) for n in range(lines))
+  # empty text still has to make a valid image
+  if not render_text(font, "").png().startswith(b"\x89PNG"):
+    raise RuntimeError("empty text didn't render")
+  return lambda: render_text(font, text).png()
+
+def exporter_bench(exporter):
+  def bench(font, size, tmp):
+    func = exporter.load()['func']
+    filename = os.path.join(tmp, "bench.c")
+    def run():
+      ret = func(font, filename)
+      if isinstance(ret, str):
+        raise RuntimeError(ret)
+    return run
+  return bench
+
+def benchmarks():
+  """ name -> benchmark function """
+  found = {
+    "font_init": bench_font_init,
+    "set_character": bench_set_character,
+    "set_packed": bench_set_packed,
+    "save": bench_save,
+    "load": bench_load,
+    "pickle_load": bench_pickle_load,
+    "render": bench_render,
+  }
+  for e in default_registry().scan():
+    found["export_" + e.key] = exporter_bench(e)
+  return found
+
+## GTK
+
+def init_gtk():
+  """ Import and start GTK without needing a real display if possible.
+      Returns None if it worked, otherwise why not. """
+  if not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+    os.environ.setdefault("GDK_BACKEND", "broadway")
+  try:
+    import gi
+    gi.require_version('Gtk', '3.0')
+    from gi.repository import Gtk
+  except (ImportError, ValueError) as e:
+    return "GTK not available (%s)" % e
+  if not Gtk.init_check(sys.argv)[0]:
+    return "no display for GTK (backend %s)" % os.environ.get("GDK_BACKEND",
+                                                                "default")
+  return None
+
+def gtk_benchmarks():
+  import cairo
+  from gi.repository import Gtk
+  from viewfont_widget import FontViewWidget
+
+  def settle():
+    while Gtk.events_pending():
+      Gtk.main_iteration_do(False)
+
+  def bench_view_build(font, size, tmp):
+    def run():
+      window = Gtk.OffscreenWindow()
+      window.add(FontViewWidget(font))
+      window.show_all()
+      settle()
+      return window.destroy
+    return run
+
+  def bench_view_render(font, size, tmp):
+    # render every atlas tile the first screenful would need
+    window = Gtk.OffscreenWindow()
+    view = FontViewWidget(font)
+    window.set_default_size(800, 600)
+    window.add(view)
+    window.show_all()
+    settle()
+    lines = range(min(view.lines, 600 // view.cell_height + 1))
+    cols = min(view.chars_per_line, 800 // view.cell_width + 1)
+    tiles = range((cols + view.tile_cols - 1) // view.tile_cols)
+    def run():
+      view.atlas.clear()
+      for line in lines:
+        for tile in tiles:
+          view.atlas_tile(line, tile)
+      surface = cairo.ImageSurface(cairo.FORMAT_RGB24, 800, 600)
+      view.expose(view.drawing, cairo.Context(surface))
+    return run
+
+  def bench_view_update(font, size, tmp):
+    window = Gtk.OffscreenWindow()
+    view = FontViewWidget(font)
+    window.add(view)
+    window.show_all()
+    settle()
+    view.atlas_tile(0, 0)
+    count = min(font.chars, view.tile_cols)
+    def run():
+      for c in range(count):
+        view.update(c)
+    return run
+
+  return {"view_build": bench_view_build,
+          "view_render": bench_view_render,
+          "view_update": bench_view_update}
+
+## running and comparing
+
+def git_revision():
+  try:
+    return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                          cwd=HERE, capture_output=True, text=True,
+                          check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def run(args):
+  sizes = [parse_size(s) for s in args.sizes.split(",")]
+  found = benchmarks()
+  skipped = {}
+  if not args.no_gtk:
+    reason = init_gtk()
+    if reason is None:
+      found.update(gtk_benchmarks())
+    else:
+      for name in ("view_build", "view_render", "view_update"):
+        skipped[name] = reason
+  if args.only:
+    found = {k: v for k, v in found.items()
+             if any(o in k for o in args.only.split(","))}
+
+  results = {}
+  with tempfile.TemporaryDirectory() as tmp:
+    for size in sizes:
+      label = "x".join(str(v) for v in size)
+      font = make_font(*size)
+      for name, bench in found.items():
+        key = "%s[%s]" % (name, label)
+        try:
+          times = timed(bench(font, size, tmp), args.repeat)
+        except Exception as e:
+          skipped[key] = "%s: %s" % (type(e).__name__, e)
+          print("%-40s failed: %s" % (key, skipped[key]), file=sys.stderr)
+          continue
+        results[key] = {"min": min(times),
+                        "median": statistics.median(times),
+                        "runs": len(times)}
+        if not args.quiet:
+          print("%-40s %10.3f ms  (median %.3f ms)" %
+                (key, min(times) * 1000, statistics.median(times) * 1000),
+                file=sys.stderr)
+
+  report = {"meta": {"python": platform.python_version(),
+                     "platform": platform.platform(),
+                     "revision": git_revision(),
+                     "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "repeat": args.repeat},
+            "results": results,
+            "skipped": skipped}
+  text = json.dumps(report, indent=2, sort_keys=True)
+  if args.output:
+    with open(args.output, "w") as fw:
+      fw.write(text + "\n")
+  else:
+    print(text)
+  return 0
+
+def compare(args):
+  with open(args.base) as fr:
+    base = json.load(fr)["results"]
+  with open(args.new) as fr:
+    new = json.load(fr)["results"]
+
+  limit = 1 + args.threshold / 100
+  failed = []
+  print("%-40s %11s %11s %8s" % ("benchmark", "base ms", "new ms", "change"))
+  for key in sorted(set(base) & set(new)):
+    b = base[key][args.stat]
+    n = new[key][args.stat]
+    ratio = n / b if b else 1.0
+    note = ""
+    if max(b, n) < args.min_time:
+      note = "  (too quick to judge)"
+    elif ratio > limit:
+      note = "  SLOWER"
+      failed.append(key)
+    print("%-40s %11.3f %11.3f %+7.1f%%%s" % (key, b * 1000, n * 1000,
+                                              (ratio - 1) * 100, note))
+  for key in sorted(set(base) ^ set(new)):
+    print("%-40s only in %s" % (key, args.base if key in base else args.new))
+
+  if failed:
+    print("%d benchmark(s) more than %g%% slower: %s" %
+          (len(failed), args.threshold, ", ".join(failed)), file=sys.stderr)
+    return 1
+  return 0
+
+def main(argv):
+  parser = argparse.ArgumentParser(description="fontedit benchmarks")
+  sub = parser.add_subparsers(dest="command", required=True)
+
+  p = sub.add_parser("run", help="run the benchmarks")
+  p.add_argument("--sizes", default=",".join(DEFAULT_SIZES),
+                 help="comma separated CHARSxROWSxCOLS (default %(default)s)")
+  p.add_argument("--repeat", type=int, default=5,
+                 help="runs of each benchmark (default %(default)s)")
+  p.add_argument("--only",
+                 help="comma separated parts of the names of benchmarks to run")
+  p.add_argument("--no-gtk", action="store_true",
+                 help="skip the GTK benchmarks")
+  p.add_argument("--output", "-o", help="write the JSON results here")
+  p.add_argument("--quiet", "-q", action="store_true")
+  p.set_defaults(func=run)
+
+  p = sub.add_parser("compare", help="compare two runs")
+  p.add_argument("base")
+  p.add_argument("new")
+  p.add_argument("--threshold", type=float, default=10.0,
+                 help="percent slowdown that counts as a regression "
+                      "(default %(default)s)")
+  p.add_argument("--stat", choices=("min", "median"), default="min",
+                 help="which timing to compare (default %(default)s)")
+  p.add_argument("--min-time", type=float, default=0.001,
+                 help="seconds below which timings aren't judged "
+                      "(default %(default)s)")
+  p.set_defaults(func=compare)
+
+  args = parser.parse_args(argv)
+  return args.func(args)
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
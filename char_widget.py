@@ -23,6 +23,9 @@ gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk
 from gi.repository import GObject
 from gi.repository import Gdk
+from math import ceil
+from profiling import traced
+
 
 class CharacterWidget(Gtk.EventBox):
     def __init__(self, font):
@@ -33,12 +36,14 @@ class CharacterWidget(Gtk.EventBox):
         # event signals
         self.drawing.connect('motion-notify-event', self.draw_motion_notify_event)
         self.drawing.connect('button-press-event', self.draw_button_press_event)
+        self.drawing.connect('button-release-event', self.draw_button_release_event)
 
         # Ask to receive events the drawing area doesn't normally
         # subscribe to
         self.drawing.set_events(self.drawing.get_events()
                       | Gdk.EventMask.LEAVE_NOTIFY_MASK
                       | Gdk.EventMask.BUTTON_PRESS_MASK
+                      | Gdk.EventMask.BUTTON_RELEASE_MASK
                       | Gdk.EventMask.POINTER_MOTION_MASK
                       | Gdk.EventMask.POINTER_MOTION_HINT_MASK)
         self.add(self.drawing)
@@ -48,31 +53,53 @@ class CharacterWidget(Gtk.EventBox):
         self.rows = font.rows
         self.cols = font.cols
 
-        self.pixels = []
-        for y in range(font.rows):
-            self.pixels.append([])
-            for x in range(font.cols):
-                self.pixels[-1].append(0)
+        # a copy-on-write GlyphBuffer, edits stay in it until commit()
+        self.pixels = font.edit_character(font.current)
 
         self._modified = False
         self.drag_value = 0
+        # packed rows when the current stroke started, for undo
+        self.stroke_start = None
         self.show_all()
     
+    @traced()
     def expose(self, area, context):
-        context.scale(area.get_allocated_width(), area.get_allocated_height())
+        width = area.get_allocated_width()
+        height = area.get_allocated_height()
+        if (width == 0) or (height == 0):
+            return True
+
+        # only visit the cells that overlap the area being redrawn, dragging
+        # the pen only queues the one cell it changed
+        x1, y1, x2, y2 = context.clip_extents()
+        first_col = max(0, int(x1 * self.cols / width))
+        last_col = min(self.cols, int(ceil(x2 * self.cols / width)))
+        first_row = max(0, int(y1 * self.rows / height))
+        last_row = min(self.rows, int(ceil(y2 * self.rows / height)))
+
+        context.scale(width, height)
 
         xstep = 1.0 / self.cols
         ystep = 1.0 / self.rows
 
-        for i in range(self.rows):
-            for j in range(self.cols):
-                if self.pixels[i][j]:
-                    context.set_source_rgb(*self.fg)
+        # sort the cells by colour so each colour is one path and one fill
+        fg_cells = []
+        bg_cells = []
+        for i in range(first_row, last_row):
+            row = self.pixels.row(i)
+            for j in range(first_col, last_col):
+                if (row >> (self.cols - 1 - j)) & 1:
+                    fg_cells.append((j * xstep, i * ystep))
                 else:
-                    context.set_source_rgb(*self.bg)
-                context.rectangle(j*xstep, i*ystep, xstep*0.95, ystep*0.95)
+                    bg_cells.append((j * xstep, i * ystep))
+
+        for colour, cells in ((self.bg, bg_cells), (self.fg, fg_cells)):
+            if cells:
+                for x, y in cells:
+                    context.rectangle(x, y, xstep * 0.95, ystep * 0.95)
+                context.set_source_rgb(*colour)
                 context.fill()
-        
+
         return True
 
     def draw_pixel(self, x, y, start=False):
@@ -88,9 +115,9 @@ class CharacterWidget(Gtk.EventBox):
 
         if (0 <= pixel_row < self.rows) and (0 <= pixel_col < self.cols):
             if start:
-                old_val = self.pixels[pixel_row][pixel_col]
+                old_val = self.pixels.get_pixel(pixel_row, pixel_col)
                 self.drag_value = old_val ^ 1
-            self.pixels[pixel_row][pixel_col] = self.drag_value
+            self.pixels.set_pixel(pixel_row, pixel_col, self.drag_value)
             self.drawing.queue_draw_area(pixel_col * xstep * width,
                                         pixel_row * ystep * height,
                                         xstep * width,
@@ -104,16 +131,40 @@ class CharacterWidget(Gtk.EventBox):
     
     def draw_button_press_event(self, area, event):
         if event.button == 1:
+            self.stroke_start = self.packed()
             self.draw_pixel(event.x, event.y, start=True)
             self._modified = True
 
+    def draw_button_release_event(self, area, event):
+        if event.button == 1 and self.stroke_start is not None:
+            old = self.stroke_start
+            self.stroke_start = None
+            self.emit("stroke", old, self.packed())
+
     def get_pixels(self):
         return self.pixels
     
     def set_pixels(self, vals):
         self.pixels = vals
+        self.stroke_start = None
         self.drawing.queue_draw()
 
+    def packed(self):
+        """ The character being edited as a list of packed rows """
+        return self.pixels.packed()
+
+    def set_packed(self, rows):
+        """ Replace the character being edited from packed rows, used by
+            undo so it counts as an edit """
+        self.pixels.set_packed(rows)
+        self._modified = True
+        self.drawing.queue_draw()
+
+    def commit(self):
+        """ Write the edits back to the font """
+        self.pixels.commit()
+        self._modified = False
+
     def set_fg(self, r, g, b):
         self.fg = (r / 65535, g / 65535, b / 65535)
         self.drawing.queue_draw()
@@ -128,3 +179,10 @@ class CharacterWidget(Gtk.EventBox):
     @property
     def modified(self):
         return self._modified
+
+# emitted at the end of a pen stroke with the packed rows from before and
+# after it
+GObject.signal_new("stroke", CharacterWidget,
+                   GObject.SignalFlags.ACTION,
+                   None,
+                   (GObject.TYPE_PYOBJECT, GObject.TYPE_PYOBJECT))
@@ -0,0 +1,118 @@
+/*
+ *    This file is part of Fontedit.
+ *    Copyright 2010-2020 Nathan Dumont
+ *
+ *    Fontedit is free software: you can redistribute it and/or modify
+ *    it under the terms of the GNU General Public License as published by
+ *    the Free Software Foundation, either version 3 of the License, or
+ *    (at your option) any later version.
+ *
+ *    Fontedit is distributed in the hope that it will be useful,
+ *    but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *    GNU General Public License for more details.
+ *
+ *    You should have received a copy of the GNU General Public License
+ *    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+#include <string.h>
+#include "font_decode.h"
+
+/* set len pixels of the glyph starting at bit pos of the stream */
+static void set_run(uint8_t *out, uint8_t cols, uint8_t row_bytes,
+                    uint32_t pos, uint32_t len)
+{
+  uint32_t row = pos / cols;
+  uint32_t col = pos % cols;
+
+  while (len--) {
+    out[row * row_bytes + (col >> 3)] |= 0x80 >> (col & 7);
+    if (++col == cols) {
+      col = 0;
+      row++;
+    }
+  }
+}
+
+static void decode_runs(const font_compressed_t *f, const uint8_t *p,
+                        const uint8_t *end, uint8_t row_bytes, uint8_t *out)
+{
+  uint32_t pos = 0;
+  uint8_t colour = 0;
+
+  while (p < end) {
+    uint8_t b = *p++;
+    uint8_t len;
+    int k;
+
+    for (k = 0; k < 2; k++) {
+      if (f->codec == FONT_CODEC_RLE4) {
+        len = k ? (b & 15) : (b >> 4);
+      } else if (k) {
+        break;
+      } else {
+        len = b;
+      }
+      if (colour && len) {
+        set_run(out, f->cols, row_bytes, pos, len);
+      }
+      pos += len;
+      colour ^= 1;
+    }
+  }
+}
+
+int font_decode(const font_compressed_t *f, uint32_t c, uint8_t *out)
+{
+  uint8_t row_bytes = (f->cols + 7) / 8;
+  uint32_t start, end;
+
+  memset(out, 0, FONT_GLYPH_BYTES(f));
+  if (c >= f->chars) {
+    return -1;
+  }
+
+  if (f->offsets16) {
+    start = f->offsets16[c];
+    end = f->offsets16[c + 1];
+  } else {
+    start = f->offsets32[c];
+    end = f->offsets32[c + 1];
+  }
+
+  switch (f->codec) {
+  case FONT_CODEC_RAW: {
+    uint32_t bits = (end - start) * 8;
+    uint32_t total = (uint32_t)f->rows * f->cols;
+    uint32_t p;
+
+    for (p = 0; p < bits && p < total; p++) {
+      if (f->data[start + (p >> 3)] & (0x80 >> (p & 7))) {
+        set_run(out, f->cols, row_bytes, p, 1);
+      }
+    }
+    break;
+  }
+  case FONT_CODEC_RLE4:
+  case FONT_CODEC_RLE8:
+    decode_runs(f, f->data + start, f->data + end, row_bytes, out);
+    break;
+  case FONT_CODEC_ROWS: {
+    uint32_t r = 0;
+    uint32_t p;
+
+    for (p = start; p < end; p += f->dict_index_size, r++) {
+      uint32_t ind = f->data[p];
+      if (f->dict_index_size == 2) {
+        ind = (ind << 8) | f->data[p + 1];
+      }
+      memcpy(out + r * row_bytes, f->dict + ind * row_bytes, row_bytes);
+    }
+    break;
+  }
+  default:
+    return -1;
+  }
+  return 0;
+}
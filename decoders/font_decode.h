@@ -0,0 +1,57 @@
+/*
+ *    This file is part of Fontedit.
+ *    Copyright 2010-2020 Nathan Dumont
+ *
+ *    Fontedit is free software: you can redistribute it and/or modify
+ *    it under the terms of the GNU General Public License as published by
+ *    the Free Software Foundation, either version 3 of the License, or
+ *    (at your option) any later version.
+ *
+ *    Fontedit is distributed in the hope that it will be useful,
+ *    but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *    GNU General Public License for more details.
+ *
+ *    You should have received a copy of the GNU General Public License
+ *    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+/*
+ * Reference decoder for fonts written by the Compressed C exporter, see
+ * glyph_codecs.py for a description of the codecs.
+ */
+
+#ifndef FONT_DECODE_H
+#define FONT_DECODE_H
+
+#include <stdint.h>
+
+#define FONT_CODEC_RAW  0
+#define FONT_CODEC_RLE4 1
+#define FONT_CODEC_RLE8 2
+#define FONT_CODEC_ROWS 3
+
+typedef struct {
+  uint8_t codec;              /* one of FONT_CODEC_* */
+  uint8_t rows;               /* height in pixels */
+  uint8_t cols;               /* width in pixels */
+  uint32_t chars;             /* number of characters */
+  const uint8_t *data;        /* compressed glyphs back to back */
+  const uint16_t *offsets16;  /* chars + 1 offsets into data, or NULL */
+  const uint32_t *offsets32;  /* used instead when data is 64k or more */
+  const uint8_t *dict;        /* FONT_CODEC_ROWS: distinct rows, packed */
+  uint8_t dict_index_size;    /* FONT_CODEC_ROWS: bytes per row index */
+} font_compressed_t;
+
+/* bytes in a decoded glyph, (cols + 7) / 8 per row */
+#define FONT_GLYPH_BYTES(f) ((f)->rows * (((f)->cols + 7) / 8))
+
+/*
+ * Decode character c into out, FONT_GLYPH_BYTES(f) bytes, laid out like
+ * the ARM C exporter: each row in (cols + 7) / 8 bytes, left most pixel
+ * in the top bit of the first byte.  Returns 0, or -1 if c is not in the
+ * font (out is then blank).
+ */
+int font_decode(const font_compressed_t *f, uint32_t c, uint8_t *out);
+
+#endif
@@ -0,0 +1,228 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+##
+## Cache of exporter output keyed on what the output depends on: the font's
+## pixels and size, the source of the exporter (and every fontedit module it
+## imports) and any options.  A hit copies the cached output into place, or
+## leaves the output file completely alone if it's already identical so
+## make doesn't see a new timestamp and rebuild everything downstream.
+##
+## Statistics an exporter returns are kept next to its output, in the
+## entry's name plus .json, so a hit returns them too.
+##
+## The cache directory is trimmed to a size limit, least recently used
+## entries first.
+##
+
+import ast
+import filecmp
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from fontfile import atomic_file
+
+DEFAULT_LIMIT = 64 * 1024 * 1024
+
+# sources every exporter may depend on besides its own module and the
+# modules it imports
+SHARED_SOURCES = ("packing.py", "internal_font_class.py", "metrics.py")
+
+def default_directory():
+  """ $FONTEDIT_CACHE_DIR, or fontedit/exports in the user cache dir """
+  if os.environ.get("FONTEDIT_CACHE_DIR"):
+    return os.environ["FONTEDIT_CACHE_DIR"]
+  base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+  return os.path.join(base, "fontedit", "exports")
+
+def _file_digest(filename):
+  with open(filename, "rb") as fr:
+    return hashlib.sha256(fr.read()).hexdigest()
+
+def _imported(filename):
+  """ Names of the top level modules filename imports, anywhere in it """
+  with open(filename, "rb") as fr:
+    tree = ast.parse(fr.read(), filename)
+  names = set()
+  for node in ast.walk(tree):
+    if isinstance(node, ast.Import):
+      names.update(a.name.split(".")[0] for a in node.names)
+    elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+      names.add(node.module.split(".")[0])
+  return names
+
+def _same_contents(a, b):
+  try:
+    return (os.path.getsize(a) == os.path.getsize(b)) and \
+           filecmp.cmp(a, b, shallow=False)
+  except OSError:
+    return False
+
+def _replace_with_copy(src, dst):
+  """ Copy src over dst without ever leaving a partial dst behind """
+  with atomic_file(dst) as tmp:
+    shutil.copyfile(src, tmp)
+
+class ExportCache:
+  """ A directory of previous exporter outputs """
+  def __init__(self, directory=None, limit=DEFAULT_LIMIT):
+    self.directory = directory or default_directory()
+    self.limit = limit
+    self.hits = 0
+    self.misses = 0
+    self._sources = {}
+    self._imports = {}
+    os.makedirs(self.directory, exist_ok=True)
+
+  def sources(self, filename):
+    """ filename and the fontedit modules it imports, directly or through
+        other fontedit modules, sorted """
+    here = os.path.dirname(os.path.abspath(__file__))
+    found = set()
+    todo = [filename]
+    while todo:
+      f = todo.pop()
+      if f in found:
+        continue
+      found.add(f)
+      if f not in self._imports:
+        self._imports[f] = [os.path.join(here, name + ".py")
+                            for name in sorted(_imported(f))
+                            if os.path.exists(os.path.join(here,
+                                                           name + ".py"))]
+      todo.extend(self._imports[f])
+    return sorted(found)
+
+  def source_digest(self, details):
+    """ Digest of the exporter's module, the shared helpers and everything
+        they import """
+    module = sys.modules[details['func'].__module__]
+    here = os.path.dirname(os.path.abspath(__file__))
+    files = set()
+    for f in [module.__file__] + [os.path.join(here, f)
+                                  for f in SHARED_SOURCES]:
+      files.update(self.sources(os.path.abspath(f)))
+    h = hashlib.sha256()
+    for f in sorted(files):
+      if f not in self._sources:
+        self._sources[f] = _file_digest(f)
+      h.update(self._sources[f].encode())
+    return h.hexdigest()
+
+  def key(self, font, details, options=None):
+    """ Cache key for exporting font with the exporter described by
+        details (an exporters dict) """
+    h = hashlib.sha256()
+    h.update(font.font_fingerprint().encode())
+    h.update(self.source_digest(details).encode())
+    h.update(json.dumps(options or {}, sort_keys=True).encode())
+    return h.hexdigest()
+
+  def entry(self, key):
+    return os.path.join(self.directory, key)
+
+  def export(self, details, font, filename, options=None):
+    """ Export font to filename with the exporter described by details,
+        using the cached output if there is one.  Returns what the exporter
+        returns: a string is an error message, a dict is statistics.  The
+        output file is only written if its contents change. """
+    entry = self.entry(self.key(font, details, options))
+
+    if os.path.exists(entry):
+      self.hits += 1
+      # bump the entry to most recently used
+      os.utime(entry)
+      if not _same_contents(entry, filename):
+        _replace_with_copy(entry, filename)
+      try:
+        with open(entry + ".json") as fr:
+          return json.load(fr)
+      except (OSError, ValueError):
+        return 0
+
+    self.misses += 1
+    # run the exporter into the cache directory, same extension as the
+    # real output in case the exporter looks at it
+    fd, tmp = tempfile.mkstemp(suffix=os.path.splitext(filename)[1],
+                               dir=self.directory)
+    os.close(fd)
+    try:
+      if options:
+        ret = details['func'](font, tmp, **options)
+      else:
+        ret = details['func'](font, tmp)
+      if isinstance(ret, str):
+        os.unlink(tmp)
+        return ret
+      if isinstance(ret, dict):
+        with atomic_file(entry + ".json") as stats:
+          with open(stats, "w") as fw:
+            json.dump(ret, fw)
+      os.replace(tmp, entry)
+    except BaseException:
+      if os.path.exists(tmp):
+        os.unlink(tmp)
+      raise
+
+    if not _same_contents(entry, filename):
+      _replace_with_copy(entry, filename)
+    return ret
+
+  def entries(self):
+    """ List of (mtime, size, path) for everything in the cache """
+    found = []
+    for name in os.listdir(self.directory):
+      if len(name) != 64:
+        # exporter output still being written
+        continue
+      path = os.path.join(self.directory, name)
+      try:
+        st = os.stat(path)
+      except FileNotFoundError:
+        continue
+      found.append((st.st_mtime, st.st_size, path))
+    return found
+
+  def evict(self):
+    """ Delete the least recently used entries until the cache is within
+        its size limit.  Returns the number of entries removed. """
+    found = sorted(self.entries())
+    total = sum(size for mtime, size, path in found)
+    removed = 0
+    for mtime, size, path in found:
+      if total <= self.limit:
+        break
+      for f in (path, path + ".json"):
+        try:
+          os.unlink(f)
+        except FileNotFoundError:
+          pass
+      total -= size
+      removed += 1
+    return removed
+
+  def report(self):
+    found = self.entries()
+    return "export cache: %d hit(s), %d miss(es), %d entries, %.1f KiB " \
+           "of %.1f KiB" % (self.hits, self.misses, len(found),
+                            sum(f[1] for f in found) / 1024,
+                            self.limit / 1024)
@@ -0,0 +1,326 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Finds the exporters without importing them.
+##
+## An exporter is a module with a module level dict
+##
+##   exporters = {"name": "ARM C",          # shown in the export dialog
+##                "desc": "...",            # one line description
+##                "cols": (1, 8),           # optional, supported widths
+##                "rows": (1, 16),          #   and heights, inclusive
+##                "func": export}           # export(font, filename)
+##
+## func returns 0 when it's done, or a string describing what went wrong.
+## It may return a dict of statistics instead of 0, the "report" entry is
+## then shown to the user with the output file's name.
+##
+## func may take a progress keyword.  The editor then passes a callback to
+## call now and then with the fraction done, which raises to stop the
+## export when the user cancels it (see packing.report_progress).
+##
+## Everything but func has to be a literal so it can be read from the
+## source with ast.  The metadata is cached on disk keyed on the module's
+## size and mtime, so listing exporters costs a stat per file and a module
+## is only imported when its exporter is actually run.  A module that won't
+## parse or import only loses that one exporter.
+##
+## Exporters come from the exporters directory next to this file and from
+## installed packages declaring a "fontedit.exporters" entry point, which
+## names a module or its exporters dict:
+##
+##   [project.entry-points."fontedit.exporters"]
+##   my_lcd = "my_package.lcd_exporter"
+##
+
+import ast
+import importlib
+import importlib.machinery
+import importlib.util
+import inspect
+import json
+import os
+import sys
+
+import profiling
+
+EXPORTERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "exporters")
+ENTRY_POINT_GROUP = "fontedit.exporters"
+# bump to throw away metadata cached by older versions
+CACHE_VERSION = 1
+
+def takes_progress(func):
+  """ True if the exporter function func accepts a progress callback """
+  try:
+    return "progress" in inspect.signature(func).parameters
+  except (TypeError, ValueError):
+    return False
+
+def default_cache_file():
+  base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+  return os.path.join(base, "fontedit", "exporters.json")
+
+def read_metadata(filename):
+  """ The literal entries of the exporters dict in a module's source,
+      without importing it.  Raises ValueError if there isn't one. """
+  with open(filename, "rb") as fr:
+    tree = ast.parse(fr.read(), filename)
+  for node in tree.body:
+    if isinstance(node, ast.Assign) and isinstance(node.value, ast.Dict) and \
+        any(isinstance(t, ast.Name) and t.id == "exporters"
+            for t in node.targets):
+      meta = {}
+      for k, v in zip(node.value.keys, node.value.values):
+        try:
+          key = ast.literal_eval(k)
+          meta[key] = ast.literal_eval(v)
+        except ValueError:
+          # func, or anything else that isn't a literal
+          pass
+      if not isinstance(meta.get("name"), str):
+        raise ValueError("exporters dict has no name")
+      return meta
+  raise ValueError("no exporters dict")
+
+def _entry_points():
+  try:
+    from importlib import metadata
+  except ImportError:
+    return []
+  eps = metadata.entry_points()
+  if hasattr(eps, "select"):
+    return list(eps.select(group=ENTRY_POINT_GROUP))
+  return list(eps.get(ENTRY_POINT_GROUP, []))
+
+def _find_source(module):
+  """ The .py file of module (a dotted name), found without importing it
+      or any package it's in, or None """
+  parts = module.split(".")
+  # a top level name is looked up without running anything, the rest are
+  # searched for in their package's directories
+  spec = importlib.util.find_spec(parts[0])
+  for k in range(1, len(parts)):
+    if (spec is None) or not spec.submodule_search_locations:
+      return None
+    spec = importlib.machinery.PathFinder.find_spec(
+             ".".join(parts[:k + 1]), list(spec.submodule_search_locations))
+  if (spec is not None) and spec.origin and spec.origin.endswith(".py"):
+    return spec.origin
+  return None
+
+class Exporter:
+  """ One exporter found by the registry.  key is the module name, or the
+      entry point name for installed exporters. """
+  def __init__(self, key, meta, path=None, entry_point=None):
+    self.key = key
+    self.name = meta["name"]
+    self.desc = meta.get("desc", "")
+    self.cols = meta.get("cols")
+    self.rows = meta.get("rows")
+    self.path = path
+    self.entry_point = entry_point
+    self._details = None
+
+  def __repr__(self):
+    return "<Exporter %s %r>" % (self.key, self.name)
+
+  def supports(self, font):
+    """ None if the exporter can handle font's size, otherwise the reason
+        it can't """
+    for what, limits, size in (("wide", self.cols, font.cols),
+                               ("high", self.rows, font.rows)):
+      if limits is not None and not limits[0] <= size <= limits[1]:
+        return "%s only supports fonts %d to %d pixels %s" % (
+               self.name, limits[0], limits[1], what)
+    return None
+
+  def load(self):
+    """ Import the exporter, returns its exporters dict """
+    if self._details is None:
+      if self.entry_point is not None:
+        obj = self.entry_point.load()
+        details = obj if isinstance(obj, dict) else obj.exporters
+      else:
+        if os.path.dirname(self.path) not in sys.path:
+          sys.path.append(os.path.dirname(self.path))
+        module = sys.modules.get(self.key)
+        if module is not None:
+          # the source has changed since it was imported
+          module = importlib.reload(module)
+        else:
+          module = importlib.import_module(self.key)
+        details = module.exporters
+      if not callable(details.get("func")):
+        raise ValueError("%s has no export function" % self.key)
+      if profiling.enabled():
+        details = dict(details, func=profiling.wrap(details["func"],
+                                                    "export " + self.key))
+      self._details = details
+    return self._details
+
+class Registry:
+  """ Every exporter that can be found, see the top of this file """
+  def __init__(self, dirs=(EXPORTERS_DIR,), cache_file=None,
+               entry_points=True):
+    self.dirs = list(dirs)
+    self.cache_file = default_cache_file() if cache_file is None \
+                      else cache_file
+    self.use_entry_points = entry_points
+    # path -> [size, mtime_ns, metadata or None, error or None]
+    self._cache = None
+    self._exporters = {}
+    self.errors = {}
+
+  def _load_cache(self):
+    self._cache = {}
+    if not self.cache_file:
+      return
+    try:
+      with open(self.cache_file) as fr:
+        data = json.load(fr)
+    except (OSError, ValueError):
+      return
+    if data.get("version") == CACHE_VERSION:
+      self._cache = data.get("files", {})
+
+  def _save_cache(self):
+    if not self.cache_file:
+      return
+    from fontfile import atomic_file
+    try:
+      os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+      with atomic_file(self.cache_file) as tmp:
+        with open(tmp, "w") as fw:
+          json.dump({"version": CACHE_VERSION, "files": self._cache}, fw)
+    except OSError:
+      # a read only cache just means parsing the sources again next time
+      pass
+
+  def _metadata(self, path):
+    """ (metadata, error, fresh) for a module, from the cache if it's
+        unchanged.  fresh is True if the source had to be read. """
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    cached = self._cache.get(path)
+    if cached is not None and cached[:2] == stamp:
+      return cached[2], cached[3], False
+    try:
+      meta, error = read_metadata(path), None
+    except (SyntaxError, ValueError) as e:
+      meta, error = None, str(e)
+    self._cache[path] = stamp + [meta, error]
+    return meta, error, True
+
+  def scan(self):
+    """ Look for exporters again, returns the list sorted by name """
+    if self._cache is None:
+      self._load_cache()
+    found = {}
+    errors = {}
+    changed = False
+    seen = set()
+    for d in self.dirs:
+      try:
+        names = sorted(os.listdir(d))
+      except OSError:
+        continue
+      for f in names:
+        key, ext = os.path.splitext(f)
+        if ext != ".py" or key.startswith("_") or key in found:
+          continue
+        path = os.path.join(d, f)
+        seen.add(path)
+        try:
+          meta, error, fresh = self._metadata(path)
+        except OSError as e:
+          errors[key] = str(e)
+          continue
+        changed |= fresh
+        if meta is None:
+          errors[key] = error
+          continue
+        old = self._exporters.get(key)
+        if old is not None and old.path == path and not fresh:
+          # keep the imported module if there is one
+          found[key] = old
+        else:
+          found[key] = Exporter(key, meta, path=path)
+
+    if self.use_entry_points:
+      for ep in _entry_points():
+        if ep.name in found:
+          continue
+        found[ep.name] = self._from_entry_point(ep, seen)
+
+    for path in list(self._cache):
+      if path not in seen:
+        del self._cache[path]
+        changed = True
+    if changed:
+      self._save_cache()
+
+    self._exporters = found
+    self.errors = errors
+    return self.exporters()
+
+  def _from_entry_point(self, ep, seen):
+    """ Read an installed exporter's metadata from its source if it can be
+        found without importing anything, otherwise just use its name """
+    module = ep.value.split(":")[0].strip()
+    meta = None
+    try:
+      origin = _find_source(module)
+      if origin is not None:
+        seen.add(origin)
+        meta = self._metadata(origin)[0]
+    except (ImportError, OSError, ValueError):
+      pass
+    if meta is None:
+      meta = {"name": ep.name}
+    return Exporter(ep.name, meta, entry_point=ep)
+
+  def exporters(self):
+    if self._cache is None:
+      self.scan()
+    return sorted(self._exporters.values(), key=lambda e: e.name.lower())
+
+  def find(self, name):
+    """ The exporter called name, either its key (e.g. arm_c) or the name
+        it shows in the export dialog.  Raises LookupError. """
+    if self._cache is None:
+      self.scan()
+    if name in self._exporters:
+      return self._exporters[name]
+    for e in self._exporters.values():
+      if e.name.lower() == name.lower():
+        return e
+    raise LookupError("No exporter called %r, available: %s" %
+                      (name, ", ".join(sorted(self._exporters))))
+
+_default = None
+
+def default_registry():
+  """ The registry for the standard exporters directory and entry points,
+      shared by everything in the process """
+  global _default
+  if _default is None:
+    _default = Registry()
+  return _default
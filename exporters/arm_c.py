@@ -22,11 +22,17 @@
 ## Exports to a C array of strings called font
 ## Each character row is represented by a byte, suitable for 
 ## use with monochrome LCDs that have bytes aligned horizontally.
+## Fonts wider than 8 pixels use as many bytes per row as needed, the
+## left most pixel in the top bit of the first byte.
 ##
 
+from packing import pack_font, row_bytes, c_escaped
+from packing import PROGRESS_EVERY, report_progress
+
 ## export function, name is unimportant but must be in the exporters
-## dictionary below.  Must take a font object and filename as arguments.
-def export(font, filename):
+## dictionary below.  Must take a font object and filename as arguments,
+## progress is optional (see exporter_registry.py).
+def export(font, filename, progress=None):
 
   # useful properties of the font object:
   # font.cols - the number of columns per character (i.e. width in px)
@@ -36,44 +42,37 @@ def export(font, filename):
   #                         returns a list of rows of integers
   #                         1 represents foreground in the editor,
   #                         0 represents background
-  if font.cols != 8:
-    # returning a string will popup an error message in the editor
-    return "Can only handle fonts of width 8"
+  # for speed the whole font can be turned into bytes in one go with the
+  # helpers in packing.py rather than looking at every pixel.
 
   # prepare the strings to start and end the file, add anything you like
   preamble = """const char *font[] = {\n"""
   postamble = """};\n"""
 
-  # open a file for writing
-  with open(filename, "w") as fw:
-    
-    # write the pre-amble
-    fw.write(preamble)
+  # every row of every character, packed into bytes and escaped for C,
+  # each byte is four characters of text
+  text = c_escaped(pack_font(font))
+  step = row_bytes(font.cols) * font.rows * 4
 
-    # itterate over all characters
-    for i in range(font.chars):
-      fw.write("  \"")
-      # fetch the array of pixels
-      c = font.get_character(i)
-      # itterate over the rows
-      for j in range(font.rows):
-        # do a shift to make a single byte bitmask of one row
-        b = 0
-        for k in range(font.cols):
-          b = (b << 1) | c[j][k]
-        # write the byte formatted as an escaped hex value for C
-        fw.write("\\x%02X" % b)
-      # add a handy comment at the end of the row if the char
-      # is a printable ascii character
-      if (i >= 32) and (i < 127):
-        comm = "  /* %c */" % i
-      else:
-        comm = ""
-      # write the end of the string and newline
-      fw.write("\",%s\n" % comm)
+  out = [preamble]
+  # itterate over all characters
+  for i in range(font.chars):
+    # let the editor show how far through we are, and stop if the export
+    # is cancelled
+    if i % PROGRESS_EVERY == 0:
+      report_progress(progress, i, font.chars)
+    # add a handy comment at the end of the row if the char
+    # is a printable ascii character
+    if (i >= 32) and (i < 127):
+      comm = "  /* %c */" % i
+    else:
+      comm = ""
+    out.append("  \"%s\",%s\n" % (text[i * step:(i + 1) * step], comm))
+  out.append(postamble)
 
-    # finally write the closure of the C list and close the file
-    fw.write(postamble)
+  # write the whole file in one go
+  with open(filename, "w") as fw:
+    fw.write("".join(out))
   
   # return zero to indicate that we were successful
   return 0
@@ -0,0 +1,101 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+##
+## Compressing exporter for fontedit
+##
+## Every glyph is compressed with each of the codecs in glyph_codecs.py
+## and the one giving the smallest tables for the whole font is used.  The
+## output defines a font_compressed_t called font, build it together with
+## decoders/font_decode.c and call font_decode() to get a glyph in the
+## same layout the ARM C exporter uses.
+##
+## Every glyph is decoded again with the Python reference decoder before
+## the file is written, a mismatch is reported as an error.  The sizes are
+## returned and written at the top of the file.
+##
+
+import glyph_codecs
+from packing import c_hex_list, progress_part
+
+def _table(text, per_line):
+  """ Split a c_hex_list() string into lines of per_line values """
+  step = per_line * 6
+  return "".join("  %s\n" % text[k:k + step].rstrip()
+                 for k in range(0, len(text), step))
+
+def export(font, filename, codec=None, progress=None):
+  """ Returns a dict of the sizes, report is a summary for the user """
+  encoding = progress_part(progress, 0.0, 0.8)
+  if codec is None:
+    enc = glyph_codecs.best(font, progress=encoding)
+  elif codec in glyph_codecs.CODECS:
+    enc = glyph_codecs.Encoded(font, codec, encoding)
+  else:
+    return "Unknown codec %s" % codec
+
+  bad = enc.verify(font, progress_part(progress, 0.8, 1.0))
+  if bad is not None:
+    return "Character %d did not decode correctly with %s" % (bad, enc.codec)
+
+  flat = font.chars * font.rows * ((font.cols + 7) // 8)
+  report = ("codec %s, %d bytes (%d data, %d offsets, %d dictionary), flat "
+            "layout %d bytes" % (enc.codec, enc.size, len(enc.data),
+                                 len(enc.offsets) * enc.offset_size,
+                                 len(enc.dictionary_bytes), flat))
+  stats = {"codec": enc.codec, "bytes": enc.size, "flat": flat,
+           "report": report}
+
+  otype = "uint16_t" if enc.offset_size == 2 else "uint32_t"
+  out = ["/* %s */\n\n" % report,
+         "#include \"font_decode.h\"\n\n",
+         "static const uint8_t font_data[%d] = {\n" % max(len(enc.data), 1),
+         # ISO C doesn't allow empty braces, a blank font gets one zero
+         _table(c_hex_list(enc.data or b"\0"), 12),
+         "};\n\n",
+         "static const %s font_offsets[%d] = {\n" % (otype, len(enc.offsets))]
+  for k in range(0, len(enc.offsets), 12):
+    out.append("  %s,\n" % ", ".join(str(o) for o in enc.offsets[k:k + 12]))
+  out.append("};\n\n")
+
+  dictionary = "0"
+  if enc.dictionary:
+    out += ["static const uint8_t font_dict[%d] = {\n" %
+            len(enc.dictionary_bytes),
+            _table(c_hex_list(enc.dictionary_bytes), 12),
+            "};\n\n"]
+    dictionary = "font_dict"
+
+  out.append("const font_compressed_t font = {\n"
+             "  FONT_CODEC_%s, %d, %d, %d,\n"
+             "  font_data, %s, %s,\n"
+             "  %s, %d\n"
+             "};\n" % (enc.codec.upper(), font.rows, font.cols, font.chars,
+                       "font_offsets" if otype == "uint16_t" else "0",
+                       "font_offsets" if otype == "uint32_t" else "0",
+                       dictionary,
+                       1 if len(enc.dictionary) <= 256 else 2))
+
+  with open(filename, "w") as fw:
+    fw.write("".join(out))
+
+  return stats
+
+exporters = {"name": "Compressed C",
+             "desc": "Compressed glyphs for use with decoders/font_decode.c",
+             "func": export}
@@ -0,0 +1,152 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+##
+## Deduplicating exporter for fontedit
+##
+## Every distinct character bitmap is written once to font_glyphs, rows
+## packed into bytes the same way as the ARM C exporter.  Characters are
+## found through font_ranges, each range covers a run of consecutive
+## characters that either use consecutive glyphs (step 1) or all share one
+## glyph (step 0, typically a run of blank characters).  font_glyph() in
+## the output does the lookup.
+##
+## A comparison with the flat one-bitmap-per-character layout is returned
+## and written at the top of the file.
+##
+
+from packing import pack_font, row_bytes, c_hex_list
+from packing import PROGRESS_EVERY, report_progress, progress_part
+
+# size of font_range_t in the output, 3 x uint16_t + uint8_t padded
+RANGE_SIZE = 8
+
+# most characters in one range, count is a uint16_t and a font can have
+# 65536 characters
+MAX_RUN = 0xFFFF
+
+def dedup(font, progress=None):
+  """ Returns (glyphs, ids) where glyphs is a list of the distinct packed
+      bitmaps in order of first use and ids gives the glyph number of each
+      character. """
+  data = pack_font(font)
+  size = row_bytes(font.cols) * font.rows
+  seen = {}
+  glyphs = []
+  ids = []
+  for i in range(font.chars):
+    if i % PROGRESS_EVERY == 0:
+      report_progress(progress, i, font.chars)
+    bitmap = data[i * size:(i + 1) * size]
+    gid = seen.get(bitmap)
+    if gid is None:
+      gid = seen[bitmap] = len(glyphs)
+      glyphs.append(bitmap)
+    ids.append(gid)
+  return glyphs, ids
+
+def ranges(ids):
+  """ Split the character to glyph mapping into runs, returns a list of
+      [first character, count, first glyph, step], none longer than
+      MAX_RUN """
+  runs = []
+  for ch, gid in enumerate(ids):
+    if runs and runs[-1][1] < MAX_RUN:
+      run = runs[-1]
+      first, count, start, step = run
+      if count == 1 and gid in (start, start + 1):
+        run[1] = 2
+        run[3] = gid - start
+        continue
+      if count > 1 and gid == start + step * count:
+        run[1] += 1
+        continue
+    runs.append([ch, 1, gid, 0])
+  return runs
+
+def export(font, filename, progress=None):
+  """ Returns a dict of the sizes, report is a summary for the user """
+  glyphs, ids = dedup(font, progress_part(progress, 0.0, 0.5))
+  runs = ranges(ids)
+  size = row_bytes(font.cols) * font.rows
+
+  flat = font.chars * size
+  indexed = len(glyphs) * size + len(runs) * RANGE_SIZE
+  report = ("%d characters, %d unique glyphs, %d ranges: %d bytes of "
+            "glyphs + %d bytes of ranges = %d bytes, flat layout %d bytes "
+            "(%.2f%%)" % (font.chars, len(glyphs), len(runs),
+                          len(glyphs) * size, len(runs) * RANGE_SIZE,
+                          indexed, flat,
+                          100.0 * indexed / flat if flat else 100.0))
+  stats = {"characters": font.chars, "glyphs": len(glyphs),
+           "ranges": len(runs), "bytes": indexed, "flat": flat,
+           "report": report}
+
+  text = c_hex_list(b"".join(glyphs))
+  step = size * 6
+
+  out = ["/* %s */\n\n" % report,
+         "#include <stdint.h>\n\n",
+         "#define FONT_ROWS %d\n" % font.rows,
+         "#define FONT_ROW_BYTES %d\n" % row_bytes(font.cols),
+         "#define FONT_GLYPH_BYTES %d\n" % size,
+         "#define FONT_CHARS %d\n\n" % font.chars,
+         "typedef struct {\n"
+         "  uint16_t first;   /* first character in the range */\n"
+         "  uint16_t count;   /* number of characters */\n"
+         "  uint16_t glyph;   /* glyph of the first character */\n"
+         "  uint8_t step;     /* 1: glyphs follow on, 0: all the same */\n"
+         "} font_range_t;\n\n",
+         "const uint8_t font_glyphs[%d][FONT_GLYPH_BYTES] = {\n" %
+         max(len(glyphs), 1)]
+  part = progress_part(progress, 0.5, 1.0)
+  for g in range(len(glyphs)):
+    if g % PROGRESS_EVERY == 0:
+      report_progress(part, g, len(glyphs))
+    out.append("  {%s},\n" % text[g * step:(g + 1) * step - 2])
+  out.append("};\n\nconst font_range_t font_ranges[%d] = {\n" %
+             max(len(runs), 1))
+  for first, count, gid, st in runs:
+    out.append("  {%d, %d, %d, %d},\n" % (first, count, gid, st))
+  out.append("};\n\n"
+             "/* bitmap for character c, NULL if it isn't in the font */\n"
+             "static inline const uint8_t *font_glyph(uint16_t c)\n"
+             "{\n"
+             "  unsigned lo = 0, hi = %d;\n"
+             "  while (lo < hi) {\n"
+             "    unsigned mid = (lo + hi) / 2;\n"
+             "    const font_range_t *r = &font_ranges[mid];\n"
+             "    if (c < r->first) {\n"
+             "      hi = mid;\n"
+             "    } else if (c >= r->first + r->count) {\n"
+             "      lo = mid + 1;\n"
+             "    } else {\n"
+             "      return font_glyphs[r->glyph + r->step * (c - r->first)];\n"
+             "    }\n"
+             "  }\n"
+             "  return 0;\n"
+             "}\n" % len(runs))
+
+  with open(filename, "w") as fw:
+    fw.write("".join(out))
+
+  return stats
+
+exporters = {"name": "Indexed C",
+             "desc": "Each distinct bitmap stored once with a range table",
+             "func": export}
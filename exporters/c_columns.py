@@ -0,0 +1,36 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Exports a C array called font_columns, each character stored column by
+## column left to right, each column in as many bytes as the height needs
+## with the top pixel in the top bit.  For displays with bytes aligned
+## vertically.
+##
+
+from packing import c_layout_source
+
+def export(font, filename, progress=None):
+  with open(filename, "w") as fw:
+    fw.write(c_layout_source(font, ("columns",), progress=progress))
+  return 0
+
+exporters = {"name": "C (column major)",
+             "desc": "Bytes down each column, top pixel in bit 7",
+             "func": export}
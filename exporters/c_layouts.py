@@ -0,0 +1,50 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Exports the font in several byte layouts at once, one C array each:
+##
+##   font_rows     each row in whole bytes, left most pixel in the top bit,
+##                 for displays with bytes aligned horizontally
+##   font_columns  each column in whole bytes, top pixel in the top bit
+##   font_pages    SSD1306 style pages of 8 rows, a byte per column with
+##                 the top pixel in bit 0
+##
+## The font is only decoded once however many layouts are asked for.  Pick
+## some with the layouts option, e.g. from the command line
+##
+##   fontedit export -f c_layouts --option layouts=rows,pages a.fnt a.c
+##
+
+from packing import LAYOUTS, c_layout_source
+
+def export(font, filename, layouts=LAYOUTS, progress=None):
+  if isinstance(layouts, str):
+    layouts = [l.strip() for l in layouts.split(",") if l.strip()]
+  unknown = [l for l in layouts if l not in LAYOUTS]
+  if unknown:
+    return "Unknown layout %s, choose from %s" % (", ".join(unknown),
+                                                 ", ".join(LAYOUTS))
+  with open(filename, "w") as fw:
+    fw.write(c_layout_source(font, layouts, progress=progress))
+  return 0
+
+exporters = {"name": "C (all layouts)",
+             "desc": "Row, column and SSD1306 page layouts in one file",
+             "func": export}
@@ -0,0 +1,112 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Proportional font exporter for fontedit
+##
+## Each glyph is stored trimmed to the box around its pixels, with tables
+## giving the box and the advance so the target never has to look at the
+## pixels to space text:
+##
+##   font_bitmaps    the trimmed glyphs, each row in (width + 7) / 8 bytes
+##                   with the left most pixel in bit 7
+##   font_offsets    where each glyph starts in font_bitmaps
+##   font_widths     size of the trimmed glyph, 0 for a blank one
+##   font_heights
+##   font_left       offset of the trimmed glyph within the character cell
+##   font_top
+##   font_advance    how far to move right after drawing the glyph
+##
+## To draw character c at x, y (the top of the cell) draw the bitmap at
+## font_offsets[c] at y + font_top[c] then add font_advance[c] to x.
+## font_left[c] is only needed to line glyphs up the way they sit in the
+## editor.
+##
+
+from packing import pack_rows, row_bytes, c_hex_list
+from packing import PROGRESS_EVERY, report_progress
+
+def _table(values, per_line=16):
+  return "".join("  %s,\n" % ", ".join(str(v) for v in values[k:k + per_line])
+                 for k in range(0, len(values), per_line))
+
+def export(font, filename, progress=None):
+  metrics = font.all_metrics()
+  cols = font.cols
+
+  # trimmed rows of every glyph, grouped by width so each width is packed
+  # in one go
+  by_width = {}
+  for n, (i, rows) in enumerate(font.glyphs()):
+    if n % PROGRESS_EVERY == 0:
+      report_progress(progress, i, font.chars)
+    m = metrics[i]
+    shift = cols - m.left - m.width
+    trimmed = [r >> shift for r in rows[m.top:m.top + m.height]]
+    by_width.setdefault(m.width, []).append((i, trimmed))
+  chunks = {}
+  for width, glyphs in by_width.items():
+    data = pack_rows([r for i, rows in glyphs for r in rows], width)
+    pos = 0
+    for i, rows in glyphs:
+      size = len(rows) * row_bytes(width)
+      chunks[i] = data[pos:pos + size]
+      pos += size
+
+  offsets = []
+  bitmaps = []
+  pos = 0
+  for i in range(font.chars):
+    offsets.append(pos)
+    if i in chunks:
+      bitmaps.append(chunks[i])
+      pos += len(chunks[i])
+  bitmaps = b"".join(bitmaps)
+
+  flat = font.chars * font.rows * row_bytes(cols)
+  otype = "uint16_t" if pos < 65536 else "uint32_t"
+  out = ["/* %d characters in a %d x %d cell, %d bytes of bitmaps (%d "
+         "untrimmed) */\n\n" % (font.chars, cols, font.rows, len(bitmaps),
+                                flat),
+         "#include <stdint.h>\n\n",
+         "#define FONT_CHARS %d\n" % font.chars,
+         "#define FONT_HEIGHT %d\n\n" % font.rows,
+         "const uint8_t font_bitmaps[%d] = {\n" % max(len(bitmaps), 1)]
+  # ISO C doesn't allow empty braces, a blank font gets one zero byte
+  text = c_hex_list(bitmaps or b"\0")
+  step = 12 * 6
+  out += ["  %s\n" % text[k:k + step].rstrip()
+          for k in range(0, len(text), step)]
+  out.append("};\n\n")
+  out += ["const %s font_offsets[%d] = {\n" % (otype, font.chars),
+          _table(offsets), "};\n\n"]
+  for name, field in (("widths", "width"), ("heights", "height"),
+                      ("left", "left"), ("top", "top"),
+                      ("advance", "advance")):
+    out += ["const uint8_t font_%s[%d] = {\n" % (name, font.chars),
+            _table([getattr(m, field) for m in metrics]), "};\n\n"]
+
+  with open(filename, "w") as fw:
+    fw.write("".join(out))
+
+  return 0
+
+exporters = {"name": "Proportional C",
+             "desc": "Trimmed glyphs with width, offset and bearing tables",
+             "func": export}
@@ -0,0 +1,37 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Exports a C array called font_pages laid out the way SSD1306 (and most
+## other small OLED controllers) take their display RAM: the character is
+## cut into pages 8 rows high, each page is one byte per column left to
+## right with the top pixel in bit 0.  A page can be sent straight to the
+## display after setting the page and column address.
+##
+
+from packing import c_layout_source
+
+def export(font, filename, progress=None):
+  with open(filename, "w") as fw:
+    fw.write(c_layout_source(font, ("pages",), progress=progress))
+  return 0
+
+exporters = {"name": "SSD1306",
+             "desc": "Vertical 8 pixel pages for SSD1306 OLEDs",
+             "func": export}
@@ -0,0 +1,386 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Importers for bitmap fonts made by other tools: BDF, PSF (versions 1
+## and 2) and PCF, any of them optionally gzipped.
+##
+## Each reader takes a binary file and returns (rows, cols, glyphs) as soon
+## as it has read the header.  glyphs is a generator of (character number,
+## packed rows) that reads the file as it goes, so only one character is
+## held at a time.  Rows are packed the way Font holds them, left most
+## pixel in bit cols - 1, with every character placed in one cell big
+## enough for the whole font (cropped at MAX_SIZE pixels).
+##
+## ranges, if given, is a list of (first, stop) character ranges as made
+## by parse_ranges(), characters outside them are skipped without being
+## decoded.
+##
+## Run as a script to convert a font:
+##
+##   python3 font_import.py unifont.bdf unifont.fnt --ranges 0x20-0x7e
+##
+
+import gzip
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+
+from fontfile import FontFileError
+from internal_font_class import Font
+from packing import REVERSE
+
+# largest cell a Font can hold, and the highest character number + 1
+MAX_SIZE = 32
+MAX_CHARS = 65536
+
+PSF1_MAGIC = b"\x36\x04"
+PSF2_MAGIC = b"\x72\xb5\x4a\x86"
+PCF_MAGIC = b"\x01fcp"
+
+# PCF table types and format bits
+PCF_METRICS = 1 << 2
+PCF_BITMAPS = 1 << 3
+PCF_BDF_ENCODINGS = 1 << 5
+PCF_BYTE_MASK = 1 << 2
+PCF_BIT_MASK = 1 << 3
+PCF_COMPRESSED_METRICS = 0x100
+
+def parse_ranges(spec):
+  """ Character ranges from a string like "0x20-0x7e,0x400-0x4ff,65",
+      as a sorted list of (first, stop) pairs.  Raises ValueError. """
+  ranges = []
+  for part in spec.replace(" ", "").split(","):
+    if not part:
+      continue
+    first, sep, last = part.partition("-")
+    first = int(first, 0)
+    last = int(last, 0) if sep else first
+    if last < first:
+      raise ValueError("range %s is backwards" % part)
+    ranges.append((first, last + 1))
+  ranges.sort()
+  return ranges
+
+def _selector(ranges):
+  """ A function telling whether a character number is wanted """
+  if ranges is None:
+    return lambda c: 0 <= c < MAX_CHARS
+  starts = [r[0] for r in ranges]
+  def wanted(c):
+    k = bisect_right(starts, c) - 1
+    return k >= 0 and c < ranges[k][1] and c < MAX_CHARS
+  return wanted
+
+def _place(values, width, top, left, rows, cols):
+  """ Put a character's rows (each width bits, left most pixel in the top
+      bit) into a rows x cols cell, top rows down and left columns in.
+      Anything outside the cell is cropped. """
+  cell = [0] * rows
+  shift = cols - left - width
+  mask = (1 << cols) - 1
+  for j, v in enumerate(values, top):
+    if 0 <= j < rows:
+      cell[j] = ((v << shift) if shift >= 0 else (v >> -shift)) & mask
+  return cell
+
+def _rows_from_bytes(data, stride, height, width):
+  """ height rows of width pixels from MSB first bytes, stride bytes per
+      row """
+  nbytes = (width + 7) // 8
+  drop = nbytes * 8 - width
+  return [int.from_bytes(data[j * stride:j * stride + nbytes], "big") >> drop
+          for j in range(height)]
+
+## BDF
+
+def read_bdf(fr, ranges=None):
+  wanted = _selector(ranges)
+  lines = iter(fr)
+  bbx = None
+  for line in lines:
+    if line.startswith(b"FONTBOUNDINGBOX"):
+      bbx = tuple(int(v) for v in line.split()[1:5])
+    elif line.startswith(b"CHARS") and not line.startswith(b"CHARSET"):
+      break
+  if bbx is None:
+    raise FontFileError("no FONTBOUNDINGBOX in BDF file")
+  fw, fh, fx, fy = bbx
+  rows = max(1, min(fh, MAX_SIZE))
+  cols = max(1, min(fw, MAX_SIZE))
+
+  def glyphs():
+    code = -1
+    gw, gh, gx, gy = bbx
+    for line in lines:
+      if line.startswith(b"ENCODING"):
+        parts = line.split()
+        code = int(parts[1])
+        if code < 0 and len(parts) > 2:
+          code = int(parts[2])
+      elif line.startswith(b"BBX"):
+        gw, gh, gx, gy = (int(v) for v in line.split()[1:5])
+      elif line.startswith(b"BITMAP"):
+        if not wanted(code):
+          for line in lines:
+            if line.startswith(b"ENDCHAR"):
+              break
+        else:
+          values = []
+          for line in lines:
+            if line.startswith(b"ENDCHAR"):
+              break
+            line = line.strip()
+            values.append(int(line, 16) >> (len(line) * 4 - gw))
+          yield code, _place(values, gw, (fh + fy) - (gh + gy), gx - fx,
+                             rows, cols)
+        code = -1
+        gw, gh, gx, gy = bbx
+      elif line.startswith(b"ENDFONT"):
+        return
+
+  return rows, cols, glyphs()
+
+## PSF
+
+def _psf1_table(data, count):
+  table = array("H")
+  table.frombytes(data[:len(data) // 2 * 2])
+  if sys.byteorder != "little":
+    table.byteswap()
+  codes = [[] for i in range(count)]
+  glyph = 0
+  in_sequence = False
+  for v in table:
+    if glyph >= count:
+      break
+    if v == 0xFFFF:
+      glyph += 1
+      in_sequence = False
+    elif v == 0xFFFE:
+      # combining sequences can't be represented, skip them
+      in_sequence = True
+    elif not in_sequence:
+      codes[glyph].append(v)
+  return codes
+
+def _psf2_table(data, count):
+  codes = []
+  for entry in data.split(b"\xff")[:count]:
+    single = entry.split(b"\xfe")[0]
+    codes.append([ord(ch) for ch in single.decode("utf-8", "replace")])
+  codes += [[] for i in range(count - len(codes))]
+  return codes
+
+def read_psf(fr, ranges=None):
+  wanted = _selector(ranges)
+  magic = fr.read(4)
+  if magic[:2] == PSF1_MAGIC:
+    mode, charsize = magic[2], magic[3]
+    count = 512 if mode & 1 else 256
+    has_table = mode & 6
+    headersize, height, width = 4, charsize, 8
+    parse_table = _psf1_table
+  elif magic == PSF2_MAGIC:
+    (version, headersize, flags, count, charsize, height,
+     width) = struct.unpack("<7I", fr.read(28))
+    has_table = flags & 1
+    parse_table = _psf2_table
+  else:
+    raise FontFileError("not a PSF file")
+  rows = max(1, min(height, MAX_SIZE))
+  cols = max(1, min(width, MAX_SIZE))
+
+  if has_table:
+    fr.seek(headersize + count * charsize)
+    codes = parse_table(fr.read(), count)
+  else:
+    codes = [[i] for i in range(count)]
+  fr.seek(headersize)
+  stride = (width + 7) // 8
+
+  def glyphs():
+    for i in range(count):
+      data = fr.read(charsize)
+      if len(data) < charsize:
+        raise FontFileError("PSF file is truncated")
+      targets = [c for c in codes[i] if wanted(c)]
+      if targets:
+        cell = _place(_rows_from_bytes(data, stride, height, width), width,
+                      0, 0, rows, cols)
+        for c in targets:
+          yield c, cell
+
+  return rows, cols, glyphs()
+
+## PCF
+
+def _pcf_table(fr, toc, kind):
+  """ Seek to a PCF table, returns its format and struct byte order """
+  if kind not in toc:
+    raise FontFileError("PCF file has no table %d" % kind)
+  fr.seek(toc[kind])
+  fmt = struct.unpack("<I", fr.read(4))[0]
+  return fmt, ">" if fmt & PCF_BYTE_MASK else "<"
+
+def _pcf_array(fr, typecode, count, order):
+  a = array(typecode)
+  a.frombytes(fr.read(count * a.itemsize))
+  if (order == ">") != (sys.byteorder == "big"):
+    a.byteswap()
+  return a
+
+def _swap_units(data, unit):
+  """ Reverse the bytes within each unit bytes of data """
+  out = bytearray(len(data))
+  for k in range(unit):
+    out[k::unit] = data[unit - 1 - k::unit]
+  return bytes(out)
+
+def read_pcf(fr, ranges=None):
+  wanted = _selector(ranges)
+  if fr.read(4) != PCF_MAGIC:
+    raise FontFileError("not a PCF file")
+  count = struct.unpack("<I", fr.read(4))[0]
+  toc = {}
+  for i in range(count):
+    kind, fmt, size, offset = struct.unpack("<4I", fr.read(16))
+    toc[kind] = offset
+
+  # metrics of every glyph, as one array per field
+  fmt, order = _pcf_table(fr, toc, PCF_METRICS)
+  if fmt & PCF_COMPRESSED_METRICS:
+    n = struct.unpack(order + "H", fr.read(2))[0]
+    raw = fr.read(n * 5)
+    lsb, rsb, ascent, descent = (array("h", (v - 0x80 for v in raw[k::5]))
+                                 for k in (0, 1, 3, 4))
+  else:
+    n = struct.unpack(order + "I", fr.read(4))[0]
+    raw = _pcf_array(fr, "h", n * 6, order)
+    lsb, rsb, ascent, descent = (raw[k::6] for k in (0, 1, 3, 4))
+  if not n:
+    raise FontFileError("PCF file has no characters")
+  left = min(lsb)
+  top = max(ascent)
+  rows = max(1, min(top + max(descent), MAX_SIZE))
+  cols = max(1, min(max(rsb) - left, MAX_SIZE))
+
+  fmt, order = _pcf_table(fr, toc, PCF_BDF_ENCODINGS)
+  min2, max2, min1, max1, default = struct.unpack(order + "5H", fr.read(10))
+  span = max2 - min2 + 1
+  index = _pcf_array(fr, "H", span * (max1 - min1 + 1), order)
+
+  fmt, order = _pcf_table(fr, toc, PCF_BITMAPS)
+  nbitmaps = struct.unpack(order + "I", fr.read(4))[0]
+  offsets = _pcf_array(fr, "I" if array("I").itemsize == 4 else "L",
+                       nbitmaps, order)
+  fr.read(16)
+  data_start = fr.tell()
+  pad = 1 << (fmt & 3)
+  unit = 1 << ((fmt >> 4) & 3)
+  msb_bits = bool(fmt & PCF_BIT_MASK)
+  swap = unit > 1 and (bool(fmt & PCF_BYTE_MASK) != msb_bits)
+
+  def glyphs():
+    for k, g in enumerate(index):
+      code = ((k // span + min1) << 8) | (k % span + min2)
+      if g == 0xFFFF or g >= min(n, nbitmaps) or not wanted(code):
+        continue
+      width = rsb[g] - lsb[g]
+      height = ascent[g] + descent[g]
+      stride = ((width + 7) // 8 + pad - 1) // pad * pad
+      fr.seek(data_start + offsets[g])
+      data = fr.read(stride * height)
+      if not msb_bits:
+        data = data.translate(REVERSE)
+      if swap:
+        data = _swap_units(data, unit)
+      yield code, _place(_rows_from_bytes(data, stride, height, width),
+                         width, top - ascent[g], lsb[g] - left, rows, cols)
+
+  return rows, cols, glyphs()
+
+READERS = {"bdf": read_bdf, "psf": read_psf, "pcf": read_pcf}
+
+def detect(fr):
+  """ Name of the format of an open file, from its first bytes """
+  start = fr.read(9)
+  fr.seek(0)
+  if start.startswith(b"STARTFONT"):
+    return "bdf"
+  if start.startswith(PSF1_MAGIC) or start.startswith(PSF2_MAGIC):
+    return "psf"
+  if start.startswith(PCF_MAGIC):
+    return "pcf"
+  raise FontFileError("not a BDF, PSF or PCF font")
+
+def _open(filename):
+  with open(filename, "rb") as fr:
+    gzipped = fr.read(2) == b"\x1f\x8b"
+  if gzipped:
+    return gzip.open(filename, "rb")
+  return open(filename, "rb")
+
+def import_font(filename, ranges=None, progress=None):
+  """ Read a BDF, PSF or PCF file into a new Font, only the characters in
+      ranges if given.  progress, if given, is called now and then with the
+      fraction of the file read (None if that isn't known) and may raise to
+      abandon the import. """
+  with _open(filename) as fr:
+    size = None
+    if not isinstance(fr, gzip.GzipFile):
+      size = os.fstat(fr.fileno()).st_size
+    rows, cols, glyphs = READERS[detect(fr)](fr, ranges)
+    font = Font(rows, cols, 0)
+    def counted():
+      for n, item in enumerate(glyphs):
+        if progress is not None and n % 1024 == 0:
+          progress(fr.tell() / size if size else None)
+        yield item
+    try:
+      font.load_glyphs(counted())
+    except (struct.error, ValueError, IndexError) as e:
+      raise FontFileError("%s is damaged (%s)" % (filename, e))
+  font.changed = True
+  return font
+
+def main(argv):
+  import argparse
+  import time
+  from fontfile import save_font
+
+  parser = argparse.ArgumentParser(description="Convert a BDF, PSF or PCF "
+                                   "font to a fontedit font")
+  parser.add_argument("input")
+  parser.add_argument("output")
+  parser.add_argument("--ranges", type=parse_ranges,
+                      help="characters to import, e.g. 0x20-0x7e,0x400-0x4ff")
+  args = parser.parse_args(argv)
+
+  start = time.perf_counter()
+  font = import_font(args.input, args.ranges)
+  save_font(font, args.output)
+  print("%d of %d characters %dx%d in %.2f s" % (len(font.populated()),
+        font.chars, font.cols, font.rows, time.perf_counter() - start))
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
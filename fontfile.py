@@ -0,0 +1,306 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+##
+## Font file format.
+##
+## All values little endian.
+##
+##   header     64 bytes, see HEADER below
+##   offsets    one u32 per character, byte offset of the character's rows
+##              from the start of the bitmap data, or BLANK if the
+##              character has no pixels set and isn't stored
+##   bitmaps    rows u32 values per stored character, the left most pixel
+##              of each row in bit cols - 1
+##
+## Version 1 files stored every character.  From version 2 blank
+## characters are never stored, so the size of a file follows the number
+## of characters drawn.
+##
+## Files are opened with mmap and the font keeps the offset table, each
+## character is looked up in the mapping when it's asked for, so opening a
+## file reads nothing but the header and the offsets.
+##
+## Saving a font back to the file it came from only writes the header and
+## the characters modified since it was loaded or last saved, as long as
+## they all already have space in the file.
+##
+## Files from older versions were a pickled Font object, these are still
+## loaded but only Font and the types it's built from may be unpickled.
+##
+
+import contextlib
+import mmap
+import os
+import pickle
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+
+from internal_font_class import Font, ROW_TYPE
+
+MAGIC = b"FNTE"
+VERSION = 2
+BLANK = 0xFFFFFFFF
+
+# magic, version, header size, rows, cols, chars, fg r/g/b, bg r/g/b,
+# scale, current character, offsets position, bitmaps position
+HEADER = struct.Struct("<4sHHHHI3H3HHIII")
+HEADER_SIZE = 64
+
+# widest character a row of ROW_TYPE holds
+MAX_COLS = 32
+
+# the row store can only be a view onto the file if it has the same layout
+_DIRECT = (sys.byteorder == "little") and (array(ROW_TYPE).itemsize == 4)
+
+# bytes of character data written between progress reports
+CHUNK = 1 << 20
+
+class FontFileError(Exception):
+  pass
+
+class _FontUnpickler(pickle.Unpickler):
+  """ Only rebuild Font objects, anything else in a pickle is refused """
+  allowed = {
+    ("internal_font_class", "Font"),
+    ("array", "array"),
+    ("array", "_array_reconstructor"),
+    ("copyreg", "_reconstructor"),
+    ("copy_reg", "_reconstructor"),
+    ("builtins", "object"),
+    ("__builtin__", "object"),
+  }
+
+  def find_class(self, module, name):
+    if (module, name) not in self.allowed:
+      raise FontFileError("%s.%s is not allowed in a font file" %
+                          (module, name))
+    return super().find_class(module, name)
+
+def _u32_array(data):
+  """ array of u32 from little endian bytes """
+  a = array(ROW_TYPE)
+  if a.itemsize == 4:
+    a.frombytes(data)
+    if sys.byteorder != "little":
+      a.byteswap()
+  else:
+    a.extend(struct.unpack("<%dI" % (len(data) // 4), data))
+  return a
+
+def _u32_bytes(values):
+  """ little endian bytes from a sequence of u32 values """
+  if isinstance(values, memoryview) or (isinstance(values, array) and
+                                         values.itemsize == 4):
+    if sys.byteorder == "little":
+      return values
+    values = array(ROW_TYPE, values)
+    values.byteswap()
+    return values
+  return struct.pack("<%dI" % len(values), *values)
+
+def load_font(filename):
+  """ Open a font file, either format """
+  with open(filename, "rb") as fr:
+    if fr.read(len(MAGIC)) != MAGIC:
+      fr.seek(0)
+      try:
+        font = _FontUnpickler(fr).load()
+      except (pickle.UnpicklingError, EOFError, AttributeError,
+              ImportError, IndexError, TypeError, ValueError) as e:
+        raise FontFileError("%s is not a font file (%s)" % (filename, e))
+      if not isinstance(font, Font):
+        raise FontFileError("%s is not a font file" % filename)
+      return font
+    mm = mmap.mmap(fr.fileno(), 0, access=mmap.ACCESS_COPY)
+
+  if len(mm) < HEADER_SIZE:
+    raise FontFileError("%s is truncated" % filename)
+  (magic, version, header_size, rows, cols, chars, fr_, fg_, fb_, br_, bg_,
+   bb_, scale, current, offsets_pos, bitmaps_pos) = HEADER.unpack_from(mm)
+  if version > VERSION:
+    raise FontFileError("%s needs a newer version of fontedit" % filename)
+  if (header_size < HEADER_SIZE) or not (rows >= 1 and
+                                         1 <= cols <= MAX_COLS):
+    raise FontFileError("%s is damaged" % filename)
+  stride = rows * 4
+  if offsets_pos + chars * 4 > len(mm):
+    raise FontFileError("%s is truncated" % filename)
+
+  font = Font(rows, cols, 0)
+  font._count = chars
+  font.fg = {'r': fr_, 'g': fg_, 'b': fb_}
+  font.bg = {'r': br_, 'g': bg_, 'b': bb_}
+  font.scale = scale
+  font.current = current if current < chars else 0
+
+  offsets = _u32_array(mm[offsets_pos:offsets_pos + chars * 4])
+  size = len(mm) - bitmaps_pos
+  if size < 0:
+    raise FontFileError("%s is truncated" % filename)
+  if _DIRECT:
+    # a private copy-on-write mapping, edits to the font don't touch the
+    # file and pages are only read in when characters are looked at
+    data = memoryview(mm)[bitmaps_pos:bitmaps_pos + size // 4 * 4]
+    data = data.cast(ROW_TYPE)
+    read = lambda off: data[off // 4:off // 4 + rows]
+  else:
+    read = lambda off: _u32_array(mm[bitmaps_pos + off:
+                                     bitmaps_pos + off + stride])
+  bad = [off for off in offsets
+         if off != BLANK and (off % 4 or off + stride > size)]
+  if bad:
+    if any(off % 4 for off in bad):
+      raise FontFileError("%s is damaged" % filename)
+    raise FontFileError("%s is truncated" % filename)
+  if version < 2:
+    # older files stored blank characters too
+    blank = bytes(stride)
+    for i, off in enumerate(offsets):
+      start = bitmaps_pos + off
+      if off != BLANK and mm[start:start + stride] == blank:
+        offsets[i] = BLANK
+  font.map_glyphs(offsets[:], read, BLANK)
+  # a version 1 file may have blank characters stored, it's always written
+  # out in full the first time
+  _mark_saved(font, filename, offsets if version >= 2 else None)
+  return font
+
+def _mark_saved(font, filename, slots):
+  """ Remember the file font matches, for incremental saves.  slots holds
+      the offset of each character in the file, BLANK if it isn't
+      stored. """
+  st = os.stat(filename)
+  font._saved = (os.path.abspath(filename), font.checkpoint(),
+                 (font.rows, font.cols, font.chars),
+                 (st.st_size, st.st_mtime_ns), slots)
+
+@contextlib.contextmanager
+def atomic_file(filename):
+  """ Context manager giving a temporary file name next to filename, which
+      replaces filename if the block finishes without an exception and is
+      deleted if it doesn't.  Readers never see a partly written file. """
+  filename = os.path.abspath(filename)
+  dirname, basename = os.path.split(filename)
+  fd, tmp = tempfile.mkstemp(prefix="." + basename, suffix=".tmp",
+                             dir=dirname)
+  os.close(fd)
+  try:
+    yield tmp
+    try:
+      mode = os.stat(filename).st_mode & 0o777
+    except FileNotFoundError:
+      umask = os.umask(0)
+      os.umask(umask)
+      mode = 0o666 & ~umask
+    os.chmod(tmp, mode)
+    os.replace(tmp, filename)
+  except BaseException:
+    if os.path.exists(tmp):
+      os.unlink(tmp)
+    raise
+
+def _report(progress, done, total):
+  if progress is not None:
+    progress(done / total if total else 1.0)
+
+def _patch(font, filename, tmp, header, progress=None):
+  """ If filename is the file font was loaded from or last saved to, and
+      nobody else has changed it, copy it to tmp and write only the
+      characters modified since.  Returns the new slots, or None if a full
+      save is needed. """
+  saved = getattr(font, "_saved", None)
+  if (saved is None) or (saved[0] != filename):
+    return None
+  if saved[2] != (font.rows, font.cols, font.chars):
+    return None
+  try:
+    st = os.stat(filename)
+  except OSError:
+    return None
+  if (st.st_size, st.st_mtime_ns) != saved[3]:
+    return None
+
+  if saved[4] is None:
+    return None
+  slots = saved[4][:]
+  modified = sorted(font.modified_since(saved[1]))
+  # a character drawn since needs space the file doesn't have
+  if any(slots[i] == BLANK and not font.is_blank(i) for i in modified):
+    return None
+
+  offsets_pos = HEADER.unpack_from(header)[-2]
+  bitmaps_pos = HEADER.unpack_from(header)[-1]
+  shutil.copyfile(filename, tmp)
+  with open(tmp, "r+b") as fw:
+    fw.write(header)
+    for n, i in enumerate(modified):
+      if font.is_blank(i):
+        if slots[i] != BLANK:
+          # cleared, its space in the file is just left unused
+          fw.seek(offsets_pos + i * 4)
+          fw.write(_u32_bytes(array(ROW_TYPE, [BLANK])))
+          slots[i] = BLANK
+      else:
+        fw.seek(bitmaps_pos + slots[i])
+        fw.write(_u32_bytes(font._glyph(i)))
+      if n % 1024 == 0:
+        _report(progress, n, len(modified))
+  return slots
+
+def save_font(font, filename, progress=None):
+  """ Write font to filename.  The data goes to a temporary file which then
+      replaces filename, so the old file is intact if anything goes wrong
+      and fonts mapped from it keep working.
+
+      progress, if given, is called with the fraction done as the file is
+      written.  An exception raised by it abandons the save. """
+  filename = os.path.abspath(filename)
+  rows = font.rows
+  chars = font.chars
+  stride = rows * 4
+  offsets_pos = HEADER_SIZE
+  bitmaps_pos = offsets_pos + chars * 4
+
+  header = HEADER.pack(MAGIC, VERSION, HEADER_SIZE, rows, font.cols, chars,
+                       font.fg['r'], font.fg['g'], font.fg['b'],
+                       font.bg['r'], font.bg['g'], font.bg['b'],
+                       font.scale, font.current, offsets_pos, bitmaps_pos)
+  header = header.ljust(HEADER_SIZE, b"\0")
+
+  with atomic_file(filename) as tmp:
+    slots = _patch(font, filename, tmp, header, progress)
+    if slots is None:
+      # only the characters with pixels set are stored, in order
+      populated = font.populated()
+      slots = array(ROW_TYPE, [BLANK]) * chars
+      for n, i in enumerate(populated):
+        slots[i] = n * stride
+      batch = max(1, CHUNK // max(stride, 1))
+      with open(tmp, "wb") as fw:
+        fw.write(header)
+        fw.write(_u32_bytes(slots))
+        for k in range(0, len(populated), batch):
+          fw.write(b"".join(_u32_bytes(font._glyph(i))
+                            for i in populated[k:k + batch]))
+          _report(progress, k, len(populated))
+    _report(progress, 1, 1)
+  _mark_saved(font, filename, slots)
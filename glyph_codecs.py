@@ -0,0 +1,345 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+##
+## Glyph compression used by the Compressed C exporter, and the Python
+## reference decoder used to check its output.  decoders/font_decode.c is
+## the matching decoder for the target.
+##
+## A glyph is treated as one stream of rows * cols bits, row by row, left
+## to right.  Trailing background is never stored, an empty glyph is zero
+## bytes.  The codecs are:
+##
+##   raw   the bit stream packed into bytes, MSB first
+##   rle4  lengths of alternating background/foreground runs, starting
+##         with background, one per nibble (high nibble first).  Runs over
+##         15 are split as 15, 0, rest
+##   rle8  the same with a byte per run, split at 255
+##   rows  an index per row into a dictionary of distinct rows shared by
+##         the whole font, one byte each or two (big endian) if there are
+##         more than 256 distinct rows.  Entry 0 is always the blank row
+##
+## Run as a script to compare the codecs on a font:
+##
+##   python3 glyph_codecs.py font.fnt [--c]
+##
+## --c also builds the C decoder and times it natively.
+##
+
+import re
+import sys
+import time
+
+from packing import pack_rows, row_bytes
+from packing import PROGRESS_EVERY, report_progress, progress_part
+
+CODECS = ("raw", "rle4", "rle8", "rows")
+# matches FONT_CODEC_* in decoders/font_decode.h
+CODEC_IDS = {"raw": 0, "rle4": 1, "rle8": 2, "rows": 3}
+
+_RUN = re.compile("0+|1+")
+
+def _stream(rows, cols):
+  """ The glyph as one integer of len(rows) * cols bits """
+  v = 0
+  for r in rows:
+    v = (v << cols) | r
+  return v
+
+def _rows(stream, rows, cols):
+  """ Split a bit stream back into packed rows """
+  mask = (1 << cols) - 1
+  return [(stream >> ((rows - 1 - j) * cols)) & mask for j in range(rows)]
+
+def _runs(rows, cols):
+  """ Alternating background/foreground run lengths, starting with
+      background, trailing background dropped """
+  n = len(rows) * cols
+  bits = format(_stream(rows, cols), "0%db" % n) if n else ""
+  runs = [len(m) for m in _RUN.findall(bits)]
+  if bits.startswith("1"):
+    runs.insert(0, 0)
+  if len(runs) % 2:
+    runs.pop()
+  return runs
+
+def _split(runs, limit):
+  out = []
+  for length in runs:
+    while length > limit:
+      out += [limit, 0]
+      length -= limit
+    out.append(length)
+  return out
+
+def row_dictionary(font):
+  """ Distinct rows of the whole font, blank first.  Returns (rows, index)
+      where index maps a row value to its position. """
+  index = {0: 0}
+  values = [0]
+  for i, rows in font.glyphs():
+    for r in rows:
+      if r not in index:
+        index[r] = len(values)
+        values.append(r)
+  return values, index
+
+def encode(codec, rows, cols, index=None):
+  """ Encode one glyph given as packed rows.  index is the row dictionary
+      index from row_dictionary(), only needed for the rows codec. """
+  if not any(rows):
+    return b""
+  if codec == "raw":
+    n = len(rows) * cols
+    nbytes = (n + 7) // 8
+    data = (_stream(rows, cols) << (nbytes * 8 - n)).to_bytes(nbytes, "big")
+    return data.rstrip(b"\0")
+  if codec == "rle4":
+    runs = _split(_runs(rows, cols), 15)
+    if len(runs) % 2:
+      runs.append(0)
+    return bytes((runs[k] << 4) | runs[k + 1] for k in range(0, len(runs), 2))
+  if codec == "rle8":
+    return bytes(_split(_runs(rows, cols), 255))
+  if codec == "rows":
+    if len(index) > 65536:
+      raise ValueError("more than 65536 distinct rows")
+    size = 1 if len(index) <= 256 else 2
+    ids = [index[r] for r in rows]
+    while ids and ids[-1] == 0:
+      ids.pop()
+    return b"".join(i.to_bytes(size, "big") for i in ids)
+  raise ValueError("unknown codec %r" % codec)
+
+def decode(codec, data, rows, cols, dictionary=None):
+  """ Reference decoder, returns the glyph as a list of packed rows.
+      dictionary is the list of rows from row_dictionary(). """
+  n = rows * cols
+  if codec == "raw":
+    nbytes = (n + 7) // 8
+    stream = int.from_bytes(data.ljust(nbytes, b"\0"), "big")
+    return _rows(stream >> (nbytes * 8 - n), rows, cols)
+  if codec in ("rle4", "rle8"):
+    if codec == "rle4":
+      runs = [v for b in data for v in (b >> 4, b & 15)]
+    else:
+      runs = data
+    stream = 0
+    pos = 0
+    colour = 0
+    for length in runs:
+      if colour and length:
+        stream |= ((1 << length) - 1) << (n - pos - length)
+      pos += length
+      colour ^= 1
+    return _rows(stream, rows, cols)
+  if codec == "rows":
+    size = 1 if len(dictionary) <= 256 else 2
+    ids = [int.from_bytes(data[k:k + size], "big")
+           for k in range(0, len(data), size)]
+    return [dictionary[i] for i in ids] + [0] * (rows - len(ids))
+  raise ValueError("unknown codec %r" % codec)
+
+class Encoded:
+  """ A whole font compressed with one codec """
+  def __init__(self, font, codec, progress=None):
+    self.codec = codec
+    self.rows = font.rows
+    self.cols = font.cols
+    self.chars = font.chars
+    self.dictionary = []
+    index = None
+    if codec == "rows":
+      self.dictionary, index = row_dictionary(font)
+
+    # blank characters encode to nothing
+    chunks = [b""] * font.chars
+    for n, (i, rows) in enumerate(font.glyphs()):
+      if n % PROGRESS_EVERY == 0:
+        report_progress(progress, i, font.chars)
+      chunks[i] = encode(codec, rows.tolist(), font.cols, index)
+    self.offsets = [0]
+    for c in chunks:
+      self.offsets.append(self.offsets[-1] + len(c))
+    self.data = b"".join(chunks)
+
+  @property
+  def offset_size(self):
+    return 2 if self.offsets[-1] < 65536 else 4
+
+  @property
+  def dictionary_bytes(self):
+    """ The row dictionary packed the same way as the decoder's output """
+    if not self.dictionary:
+      return b""
+    return pack_rows(self.dictionary, self.cols)
+
+  @property
+  def size(self):
+    """ Bytes of flash needed for the data, offsets and dictionary """
+    return (len(self.data) + len(self.offsets) * self.offset_size +
+            len(self.dictionary_bytes))
+
+  def glyph(self, i):
+    return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+  def decode(self, i):
+    return decode(self.codec, self.glyph(i), self.rows, self.cols,
+                  self.dictionary)
+
+  def verify(self, font, progress=None):
+    """ Check every glyph decodes back to the font, returns the index of
+        the first that doesn't or None """
+    for i in range(self.chars):
+      if i % PROGRESS_EVERY == 0:
+        report_progress(progress, i, self.chars)
+      original = font.get_packed(i)
+      if self.offsets[i] == self.offsets[i + 1]:
+        if any(original):
+          return i
+      elif self.decode(i) != original:
+        return i
+    return None
+
+def encodings(font, codecs=CODECS, progress=None):
+  """ font encoded with each of codecs that can encode it """
+  for n, c in enumerate(codecs):
+    part = progress_part(progress, n / len(codecs), (n + 1) / len(codecs))
+    try:
+      yield Encoded(font, c, part)
+    except ValueError:
+      pass
+
+def best(font, codecs=CODECS, progress=None):
+  """ Encode font with every codec and return the smallest """
+  return min(encodings(font, codecs, progress), key=lambda e: e.size)
+
+def benchmark(font, codecs=CODECS):
+  """ Compression ratio and Python decode cost of each codec, returns a list
+      of dicts """
+  flat = font.chars * font.rows * row_bytes(font.cols)
+  results = []
+  for codec in codecs:
+    start = time.perf_counter()
+    try:
+      enc = Encoded(font, codec)
+    except ValueError:
+      continue
+    encode_time = time.perf_counter() - start
+
+    stored = [i for i in range(font.chars)
+              if enc.offsets[i] != enc.offsets[i + 1]]
+    start = time.perf_counter()
+    for i in stored:
+      enc.decode(i)
+    decode_time = time.perf_counter() - start
+
+    lengths = [enc.offsets[i + 1] - enc.offsets[i] for i in stored]
+    results.append({
+      "codec": codec,
+      "size": enc.size,
+      "ratio": enc.size / flat if flat else 1.0,
+      "encode_s": encode_time,
+      "decode_us_per_glyph": decode_time * 1e6 / max(len(stored), 1),
+      "mean_glyph_bytes": sum(lengths) / max(len(lengths), 1),
+      "max_glyph_bytes": max(lengths, default=0),
+    })
+  return results
+
+def c_benchmark(font, codec, repeat=20):
+  """ Build the C reference decoder against an export of font and time it,
+      returns nanoseconds per glyph decoded """
+  import os
+  import subprocess
+  import tempfile
+  sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "exporters"))
+  import arm_c_compressed
+
+  here = os.path.dirname(os.path.abspath(__file__))
+  decoders = os.path.join(here, "decoders")
+  with tempfile.TemporaryDirectory() as tmp:
+    table = os.path.join(tmp, "font_table.c")
+    ret = arm_c_compressed.export(font, table, codec=codec)
+    if isinstance(ret, str):
+      raise RuntimeError(ret)
+    main = os.path.join(tmp, "bench.c")
+    with open(main, "w") as fw:
+      fw.write(BENCH_MAIN % {"repeat": repeat})
+    exe = os.path.join(tmp, "bench")
+    subprocess.run(["cc", "-O2", "-I", decoders, "-o", exe, main, table,
+                    os.path.join(decoders, "font_decode.c")], check=True)
+    out = subprocess.run([exe], check=True, capture_output=True, text=True)
+    return float(out.stdout)
+
+BENCH_MAIN = """
+#include <stdio.h>
+#include <time.h>
+#include "font_decode.h"
+
+extern const font_compressed_t font;
+
+int main(void)
+{
+  static uint8_t buf[32 * 4];
+  volatile uint8_t sink = 0;
+  struct timespec a, b;
+  unsigned rep;
+  uint32_t c;
+  clock_gettime(CLOCK_MONOTONIC, &a);
+  for (rep = 0; rep < %(repeat)d; rep++) {
+    for (c = 0; c < font.chars; c++) {
+      font_decode(&font, c, buf);
+      sink ^= buf[0];
+    }
+  }
+  clock_gettime(CLOCK_MONOTONIC, &b);
+  printf("%%f\\n", ((b.tv_sec - a.tv_sec) * 1e9 + (b.tv_nsec - a.tv_nsec)) /
+                  ((double)%(repeat)d * font.chars));
+  return 0;
+}
+"""
+
+def main(argv):
+  import argparse
+  from fontfile import load_font
+
+  parser = argparse.ArgumentParser(description="Compare glyph codecs")
+  parser.add_argument("font")
+  parser.add_argument("--c", action="store_true",
+                      help="also time the C reference decoder")
+  args = parser.parse_args(argv)
+
+  font = load_font(args.font)
+  flat = font.chars * font.rows * row_bytes(font.cols)
+  print("%d characters %dx%d, flat layout %d bytes" % (font.chars, font.cols,
+                                                       font.rows, flat))
+  print("%-6s %10s %7s %10s %10s %12s%s" % ("codec", "bytes", "ratio",
+        "mean B/ch", "max B/ch", "py us/glyph", "   C ns/glyph" if args.c
+        else ""))
+  for r in benchmark(font):
+    line = "%-6s %10d %6.1f%% %10.1f %10d %12.2f" % (r["codec"], r["size"],
+           r["ratio"] * 100, r["mean_glyph_bytes"], r["max_glyph_bytes"],
+           r["decode_us_per_glyph"])
+    if args.c:
+      line += " %14.1f" % c_benchmark(font, r["codec"])
+    print(line)
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,171 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Undo/redo history.
+##
+## An entry only keeps the XOR of the packed rows it changed, from the
+## first changed row to the last, so a pen stroke on a 32x32 character
+## costs a few bytes plus the entry itself.  Applying the same XOR again
+## undoes or redoes it.
+##
+## Two kinds of entry are kept:
+##
+##   strokes  edits in the character editor that haven't been committed
+##            to the font yet, always for the character being edited
+##   commits  changes to a character in the font, recorded by
+##            Font.set_packed when the font has a history attached
+##
+## Committing a character folds the strokes made on it into the commit,
+## and moving to another character without committing drops them.  The
+## total size of the history is kept under a limit by forgetting the
+## oldest entries.
+##
+
+import contextlib
+import sys
+from array import array
+from collections import deque
+
+from internal_font_class import ROW_TYPE
+
+DEFAULT_LIMIT = 4 * 1024 * 1024
+
+class Delta:
+  """ The change to one character: rows first to first + len(xor) - 1
+      XORed with xor """
+  __slots__ = ("ind", "first", "xor", "stroke")
+
+  def __init__(self, ind, first, xor, stroke):
+    self.ind = ind
+    self.first = first
+    self.xor = xor
+    self.stroke = stroke
+
+  @classmethod
+  def between(cls, ind, old, new, stroke=False):
+    """ The delta turning rows old into rows new, None if they're equal """
+    changed = [j for j in range(len(old)) if old[j] != new[j]]
+    if not changed:
+      return None
+    first, last = changed[0], changed[-1]
+    xor = array(ROW_TYPE, (old[j] ^ new[j] for j in range(first, last + 1)))
+    return cls(ind, first, xor.tobytes(), stroke)
+
+  def apply(self, rows):
+    """ rows, a list of packed rows, with this change applied or undone """
+    rows = list(rows)
+    xor = array(ROW_TYPE)
+    xor.frombytes(self.xor)
+    for j, x in enumerate(xor, self.first):
+      rows[j] ^= x
+    return rows
+
+  @property
+  def size(self):
+    """ Approximate memory used by the entry in bytes """
+    return sys.getsizeof(self) + sys.getsizeof(self.xor)
+
+class History:
+  """ Undo and redo stacks of Deltas, see the top of this file """
+  def __init__(self, limit=DEFAULT_LIMIT):
+    self.limit = limit
+    self.undo_stack = deque()
+    self.redo_stack = []
+    self.size = 0
+    self._paused = 0
+
+  def __len__(self):
+    return len(self.undo_stack)
+
+  def can_undo(self):
+    return bool(self.undo_stack)
+
+  def can_redo(self):
+    return bool(self.redo_stack)
+
+  @contextlib.contextmanager
+  def paused(self):
+    """ Changes made inside the block aren't recorded, for applying undo
+        and redo themselves """
+    self._paused += 1
+    try:
+      yield
+    finally:
+      self._paused -= 1
+
+  def _push(self, delta):
+    self.undo_stack.append(delta)
+    self.size += delta.size
+    for d in self.redo_stack:
+      self.size -= d.size
+    self.redo_stack = []
+    # forget the oldest entries, but always keep the newest
+    while self.size > self.limit and len(self.undo_stack) > 1:
+      self.size -= self.undo_stack.popleft().size
+
+  def _drop_strokes(self, stack, pop):
+    while stack and stack[-1].stroke:
+      self.size -= pop().size
+
+  def stroke(self, ind, old, new):
+    """ Record an edit to character ind in the editor, old and new are its
+        packed rows before and after """
+    if self._paused:
+      return
+    delta = Delta.between(ind, old, new, stroke=True)
+    if delta is not None:
+      self._push(delta)
+
+  def commit(self, ind, old, new):
+    """ Record character ind of the font changing from rows old to new,
+        replacing any strokes that led up to it """
+    if self._paused:
+      return
+    self.drop_strokes()
+    delta = Delta.between(ind, old, new)
+    if delta is not None:
+      self._push(delta)
+
+  def drop_strokes(self):
+    """ Forget uncommitted strokes, the edits they recorded are gone """
+    self._drop_strokes(self.undo_stack, self.undo_stack.pop)
+    self._drop_strokes(self.redo_stack, self.redo_stack.pop)
+
+  def undo(self):
+    """ Take the newest entry off the undo stack and return it, the caller
+        applies it.  None if there's nothing to undo. """
+    if not self.undo_stack:
+      return None
+    delta = self.undo_stack.pop()
+    self.redo_stack.append(delta)
+    return delta
+
+  def redo(self):
+    """ Take the newest entry off the redo stack and return it """
+    if not self.redo_stack:
+      return None
+    delta = self.redo_stack.pop()
+    self.undo_stack.append(delta)
+    return delta
+
+  def clear(self):
+    self.undo_stack.clear()
+    self.redo_stack = []
+    self.size = 0
@@ -16,55 +16,577 @@
 ##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
 ##
 
+from array import array
+from bisect import bisect_left
+from hashlib import blake2b
+
+from metrics import glyph_metrics, batch_metrics, blank_metrics
+
+# each row of a glyph is stored as a single machine integer, the left most
+# pixel in the most significant used bit (bit cols - 1).  Rows can be up to
+# 32 pixels wide so we need at least a 32 bit type.
+ROW_TYPE = 'I' if array('I').itemsize >= 4 else 'L'
+
+def row_array(values):
+  """ Copy a sequence of packed rows (list, array or memoryview) into an
+      array of ROW_TYPE """
+  rows = array(ROW_TYPE)
+  if isinstance(values, memoryview) and values.itemsize == rows.itemsize:
+    rows.frombytes(values.cast('B'))
+  else:
+    rows.extend(values)
+  return rows
+
+def pack_row(pixels, cols):
+  """ Convert a sequence of pixel values into a packed row integer """
+  val = 0
+  for k in range(cols):
+    val = (val << 1) | (1 if pixels[k] else 0)
+  return val
+
+def pack_glyph(pixels, rows, cols):
+  """ Convert a glyph given as a list of rows of pixels, or a GlyphView,
+      into a list of packed row integers """
+  if isinstance(pixels, (GlyphView, GlyphBuffer)):
+    return pixels.packed()
+  return [pack_row(pixels[j], cols) for j in range(rows)]
+
+class RowView:
+  """ A single row of a glyph.  Indexes like the list of pixels fonts used
+      to be made of but reads and writes bits in the packed store. """
+  __slots__ = ("_font", "_ind", "_row")
+
+  def __init__(self, font, ind, row):
+    self._font = font
+    self._ind = ind
+    self._row = row
+
+  def __len__(self):
+    return self._font._cols
+
+  def _value(self):
+    return self._font._glyph(self._ind)[self._row]
+
+  def _bit(self, ind):
+    cols = self._font._cols
+    if ind < 0:
+      ind += cols
+    if not 0 <= ind < cols:
+      raise IndexError("pixel index out of range")
+    return 1 << (cols - 1 - ind)
+
+  def __getitem__(self, ind):
+    if isinstance(ind, slice):
+      return [self[k] for k in range(*ind.indices(self._font._cols))]
+    return 1 if self._value() & self._bit(ind) else 0
+
+  def __setitem__(self, ind, val):
+    bit = self._bit(ind)
+    old = self._value()
+    new = (old | bit) if val else (old & ~bit)
+    if new != old:
+      self._font._set_row(self._ind, self._row, new)
+
+  def __iter__(self):
+    val = self._value()
+    for k in range(self._font._cols - 1, -1, -1):
+      yield (val >> k) & 1
+
+  def __eq__(self, other):
+    return list(self) == list(other)
+
+  def __repr__(self):
+    return repr(list(self))
+
+class GlyphView:
+  """ The rows of one character in a Font.  Behaves like the list of rows of
+      pixels returned by earlier versions, c[row][col] reads and writes
+      pixels straight through to the font. """
+  __slots__ = ("_font", "_ind")
+
+  def __init__(self, font, ind):
+    self._font = font
+    self._ind = ind
+
+  def __len__(self):
+    return self._font._rows
+
+  def __getitem__(self, ind):
+    rows = self._font._rows
+    if isinstance(ind, slice):
+      return [self[j] for j in range(*ind.indices(rows))]
+    if ind < 0:
+      ind += rows
+    if not 0 <= ind < rows:
+      raise IndexError("row index out of range")
+    return RowView(self._font, self._ind, ind)
+
+  def __iter__(self):
+    for j in range(self._font._rows):
+      yield RowView(self._font, self._ind, j)
+
+  def __eq__(self, other):
+    return [list(r) for r in self] == [list(r) for r in other]
+
+  def __repr__(self):
+    return repr([list(r) for r in self])
+
+  def packed(self):
+    """ The rows of this character as a list of packed integers """
+    return self._font._glyph(self._ind).tolist()
+
+class GlyphBuffer:
+  """ Copy-on-write edit buffer for one character of a Font.  Until the
+      first write it reads straight from the font, so handing one to the
+      editor costs nothing.  The first write copies the character's rows
+      and later writes only touch the copy, commit() puts them back in the
+      font. """
+  __slots__ = ("_font", "ind", "_rows")
+
+  def __init__(self, font, ind):
+    self._font = font
+    self.ind = font._index(ind)
+    self._rows = None
+
+  def __len__(self):
+    return self._font._rows
+
+  @property
+  def forked(self):
+    """ True once the buffer has its own copy of the rows """
+    return self._rows is not None
+
+  def row(self, j):
+    """ Packed value of row j """
+    if self._rows is not None:
+      return self._rows[j]
+    return self._font._glyph(self.ind)[j]
+
+  def packed(self):
+    """ The rows as a new list of packed integers """
+    if self._rows is not None:
+      return list(self._rows)
+    return self._font.get_packed(self.ind)
+
+  def get_pixel(self, j, k):
+    return (self.row(j) >> (self._font._cols - 1 - k)) & 1
+
+  def set_pixel(self, j, k, val):
+    bit = 1 << (self._font._cols - 1 - k)
+    if self._rows is None:
+      if bool(self.row(j) & bit) == bool(val):
+        return
+      self._rows = self._font.get_packed(self.ind)
+    if val:
+      self._rows[j] |= bit
+    else:
+      self._rows[j] &= ~bit
+
+  def set_packed(self, rows):
+    """ Replace every row """
+    self._rows = self._font._fit(rows).tolist()
+
+  def commit(self):
+    """ Write the edits back to the font, where they count as a change to
+        the character if they differ from it, and go back to reading
+        through to the font """
+    if self._rows is not None:
+      self._font.set_packed(self.ind, self._rows)
+      self._rows = None
+
+  def __getitem__(self, ind):
+    # rows of pixels, read only, for code expecting lists of lists
+    return [(self.row(ind) >> k) & 1
+            for k in range(self._font._cols - 1, -1, -1)]
+
+  def __iter__(self):
+    for j in range(self._font._rows):
+      yield self[j]
+
+  def __repr__(self):
+    return repr(list(self))
+
 class Font:
   """ Base class for all fonts.  Each new font created generates a Font object
-      saving and loading are achieved by pickling/unpickling this object. """
+      saving and loading are achieved by pickling/unpickling this object.
+
+      Pixels are held packed, one integer per row.  Only characters with
+      pixels set are stored, as an array of rows per character in a dict
+      keyed by character number, and every blank character reads as the
+      same array of zeros.  So memory use follows the number of characters
+      drawn, not chars.  The arrays are never changed in place, a change
+      to a character stores a new one, which makes copying the dict enough
+      to snapshot the font.
+
+      A font opened from a file doesn't copy its characters into the dict,
+      see map_glyphs().  They're looked up in the file when asked for and
+      only characters changed since go in the dict. """
   def __init__(self, rows, cols, chars):
     self._rows = rows
     self._cols = cols
-    self._chars = []
-    for i in range(chars):
-      self._chars.append([])
-      for j in range(rows):
-        self._chars[i].append([])
-        for k in range(cols):
-          self._chars[i][j].append(0)
+    self._count = chars
+    self._glyphs = {}
+    self._blank = array(ROW_TYPE, [0]) * rows
+    # (offsets, read, blank) for characters still in a mapped file
+    self._mapped = None
     self.current = 0
     self.changed = False
     self.fg = {'r': 65535, 'g': 65535, 'b': 65535}
     self.bg = {'r': 0, 'g': 0, 'b': 0}
     self.scale = 1
+    # a history.History to record changes in, for undo
+    self.history = None
+    self._init_tracking()
+
+  def _init_tracking(self):
+    # every modification bumps _generation and records it against the
+    # character in _dirty, so the characters changed since any checkpoint
+    # can be listed without looking at the pixels
+    self._generation = 0
+    self._dirty = {}
+    self._fingerprints = {}
+    # metrics.Metrics of characters with pixels set, dropped when the
+    # character changes and worked out again when next asked for
+    self._metrics = {}
+    # sorted keys of _glyphs, None when a character has been added or
+    # cleared since it was last needed
+    self._order = None
+
+  def __getstate__(self):
+    state = self.__dict__.copy()
+    for k in ("_generation", "_dirty", "_fingerprints", "_metrics", "_order",
+              "_saved", "history", "_blank", "_mapped"):
+      state.pop(k, None)
+    # characters mapped from a font file become arrays
+    state["_glyphs"] = {i: row_array(g) for i, g in self.glyphs()}
+    return state
+
+  def __setstate__(self, state):
+    rows = state["_rows"]
+    if "_chars" in state:
+      # font saved before pixels were packed, one list entry per pixel
+      chars = state.pop("_chars")
+      state["_glyphs"] = {}
+      for i, c in enumerate(chars):
+        packed = pack_glyph(c, rows, state["_cols"])
+        if any(packed):
+          state["_glyphs"][i] = array(ROW_TYPE, packed)
+      state["_count"] = len(chars)
+    elif "_packed" in state:
+      # every character in one flat array
+      packed = state.pop("_packed")
+      state["_glyphs"] = {}
+      for i in range(state["_count"]):
+        g = packed[i * rows:(i + 1) * rows]
+        if any(g):
+          state["_glyphs"][i] = g
+    state.setdefault("scale", 1)
+    state["history"] = None
+    self.__dict__.update(state)
+    self._blank = array(ROW_TYPE, [0]) * rows
+    self._mapped = None
+    self._init_tracking()
+
+  def map_glyphs(self, offsets, read, blank):
+    """ Take characters from somewhere else, a mapped font file.
+        offsets[i] is where character i is, or blank if it has no pixels
+        set, and read(offset) returns its packed rows.  Nothing is read
+        until a character is asked for.  offsets is kept and changed as
+        characters are replaced. """
+    self._mapped = (offsets, read, blank)
+    self._order = None
+
+  def _has(self, ind):
+    """ True if character ind has pixels set """
+    if ind in self._glyphs:
+      return True
+    if self._mapped is None:
+      return False
+    offsets, read, blank = self._mapped
+    return ind < len(offsets) and offsets[ind] != blank
+
+  def _unmap(self, ind):
+    """ Character ind is about to be replaced, forget where it was in the
+        mapped file """
+    if self._mapped is not None:
+      offsets, read, blank = self._mapped
+      if ind < len(offsets):
+        offsets[ind] = blank
 
   def get_rows(self):
     """ Number of rows of pixels in the character """
     return self._rows
 
   def set_rows(self, val):
-    if isinstance(val, [int, long]) and (val < 33) and (val > 0):
-      self._rows = val
+    """ Change the height, characters are cut or padded at the bottom """
+    if isinstance(val, int) and (val < 33) and (val > 0):
+      from transforms import resize
+      resize(self, val, self._cols)
 
   def get_cols(self):
     """ Number of columns of pixels in the character """
     return self._cols
 
   def set_cols(self, val):
-    if isinstance(val, [int, long]) and (val < 33) and (val > 0):
-      self._cols = val
+    """ Change the width, characters are cut or padded at the right """
+    if isinstance(val, int) and (val < 33) and (val > 0):
+      from transforms import resize
+      resize(self, self._rows, val)
 
   @property
   def chars(self):
     """ Number of characters in this object """
-    return len(self._chars)
+    return self._count
+
+  def _index(self, ind):
+    if ind < 0:
+      ind += self._count
+    if not 0 <= ind < self._count:
+      raise IndexError("character index out of range")
+    return ind
 
   def get_character(self, ind):
-    return self._chars[ind]
+    """ Character number ind as a list-like view of rows of pixels """
+    return GlyphView(self, self._index(ind))
+
+  def edit_character(self, ind):
+    """ Character number ind as a copy-on-write GlyphBuffer for editing """
+    return GlyphBuffer(self, ind)
 
   def set_character(self, ind, val):
-    for i in range(self._rows):
-      for j in range(self._cols):
-        if self._chars[ind][i][j] != val[i][j]:
-          self.changed = True
-        self._chars[ind][i][j] = val[i][j]
+    """ Replace character number ind with val, a list of rows of pixels """
+    self.set_packed(ind, pack_glyph(val, self._rows, self._cols))
+
+  def _glyph(self, ind):
+    """ The rows of character ind, shared, don't modify them """
+    g = self._glyphs.get(ind)
+    if g is not None:
+      return g
+    if self._mapped is not None:
+      offsets, read, blank = self._mapped
+      if ind < len(offsets) and offsets[ind] != blank:
+        return read(offsets[ind])
+    return self._blank
+
+  def get_packed(self, ind):
+    """ Character number ind as a list of packed row integers, the left most
+        pixel in bit cols - 1 """
+    return self._glyph(self._index(ind)).tolist()
+
+  def packed_data(self):
+    """ Every row of every character as one flat array of integers,
+        character i occupies [i * rows:(i + 1) * rows].  Used by the
+        exporters to work on the whole font at once, it's built on each
+        call so for sparse fonts prefer glyphs(). """
+    rows = self._rows
+    flat = array(ROW_TYPE, [0]) * (rows * self._count)
+    view = memoryview(flat)
+    for i, g in self.glyphs():
+      view[i * rows:(i + 1) * rows] = g
+    return flat
+
+  def populated(self, start=0, stop=None):
+    """ Numbers of the characters with pixels set, in order, only those in
+        [start, stop) if given """
+    if self._order is None:
+      stored = set(self._glyphs)
+      if self._mapped is not None:
+        offsets, read, blank = self._mapped
+        stored.update(i for i, off in enumerate(offsets) if off != blank)
+      self._order = sorted(stored)
+    order = self._order
+    first = bisect_left(order, start) if start else 0
+    last = len(order) if stop is None else bisect_left(order, stop)
+    return order[first:last]
+
+  def populated_ranges(self, start=0, stop=None):
+    """ Runs of consecutive characters with pixels set, as a list of
+        (first, stop) pairs """
+    runs = []
+    for i in self.populated(start, stop):
+      if runs and runs[-1][1] == i:
+        runs[-1][1] = i + 1
+      else:
+        runs.append([i, i + 1])
+    return [tuple(r) for r in runs]
+
+  def glyphs(self, start=0, stop=None):
+    """ (character number, rows) for each character with pixels set, in
+        order.  The rows are shared with the font, treat them as read only. """
+    for i in self.populated(start, stop):
+      yield i, self._glyph(i)
+
+  def is_blank(self, ind):
+    return not self._has(self._index(ind))
+
+  def set_packed(self, ind, rows):
+    """ Replace character number ind from a list of packed row integers """
+    ind = self._index(ind)
+    new = self._fit(rows)
+    old = self._glyph(ind)
+    if old != new:
+      if self.history is not None:
+        self.history.commit(ind, old.tolist(), new.tolist())
+      self._store(ind, new)
+
+  def _fit(self, rows):
+    """ Packed rows as an array exactly as tall as the font, padded with
+        blank rows, each row cut down to the font's width """
+    mask = (1 << self._cols) - 1
+    new = array(ROW_TYPE, [r & mask for r in rows[:self._rows]])
+    if len(new) < self._rows:
+      new.extend([0] * (self._rows - len(new)))
+    return new
+
+  def load_glyphs(self, items):
+    """ Store (character number, packed rows) pairs in bulk, growing the
+        font to fit.  For importers, the changes aren't recorded for undo.
+        Returns the number of characters stored. """
+    rows = self._rows
+    generation = self._generation + 1
+    count = self._count
+    n = 0
+    for ind, packed in items:
+      packed = array(ROW_TYPE, packed[:rows])
+      if len(packed) < rows:
+        packed.extend([0] * (rows - len(packed)))
+      if ind >= count:
+        count = ind + 1
+      self._unmap(ind)
+      if any(packed):
+        self._glyphs[ind] = packed
+      else:
+        self._glyphs.pop(ind, None)
+      self._dirty[ind] = generation
+      self._fingerprints.pop(ind, None)
+      self._metrics.pop(ind, None)
+      n += 1
+    self._count = count
+    self._generation = generation
+    self._order = None
+    if n:
+      self.changed = True
+    return n
+
+  def replace_glyphs(self, rows, cols, glyphs):
+    """ Change the size of the characters to rows x cols, glyphs is a dict
+        of character number -> packed rows of the new size for every
+        character with pixels set.  Every character counts as modified. """
+    self._rows = rows
+    self._cols = cols
+    self._blank = array(ROW_TYPE, [0]) * rows
+    self._glyphs = {i: array(ROW_TYPE, g) for i, g in glyphs.items()
+                    if any(g)}
+    self._mapped = None
+    self._order = None
+    self._fingerprints = {}
+    self._metrics = {}
+    self._generation += 1
+    self._dirty = dict.fromkeys(range(self._count), self._generation)
+    self.changed = True
+
+  def _set_row(self, ind, row, value):
+    # through set_packed so the edit can be undone like any other
+    rows = self._glyph(ind).tolist()
+    rows[row] = value
+    self.set_packed(ind, rows)
+
+  def _store(self, ind, rows):
+    was = self._has(ind)
+    now = any(rows)
+    self._unmap(ind)
+    if now:
+      self._glyphs[ind] = rows
+    else:
+      self._glyphs.pop(ind, None)
+    if now != was:
+      self._order = None
+    self._touch(ind)
+
+  def _touch(self, ind):
+    """ Record that character ind has been modified """
+    self.changed = True
+    self._generation += 1
+    self._dirty[ind] = self._generation
+    self._fingerprints.pop(ind, None)
+    self._metrics.pop(ind, None)
+
+  def snapshot(self):
+    """ An independent copy of the font as it is now, with the same change
+        tracking.  Saves and exports work on a snapshot in the background
+        so the font can go on being edited. """
+    copy = Font.__new__(Font)
+    copy.__dict__.update(self.__dict__)
+    copy._glyphs = dict(self._glyphs)
+    if self._mapped is not None:
+      offsets, read, blank = self._mapped
+      copy._mapped = (offsets[:], read, blank)
+    copy.fg = dict(self.fg)
+    copy.bg = dict(self.bg)
+    copy._dirty = dict(self._dirty)
+    copy._fingerprints = dict(self._fingerprints)
+    copy._metrics = dict(self._metrics)
+    copy.history = None
+    return copy
+
+  def checkpoint(self):
+    """ A token for the current state of the font, pass it to
+        modified_since later to find what has changed """
+    return self._generation
+
+  def modified_since(self, token):
+    """ Set of the characters modified since checkpoint() returned token """
+    if token >= self._generation:
+      return set()
+    return {i for i, gen in self._dirty.items() if gen > token}
+
+  def fingerprint(self, ind):
+    """ Digest of the pixels of character ind, identical characters (in
+        fonts of the same size) have identical fingerprints """
+    ind = self._index(ind)
+    try:
+      return self._fingerprints[ind]
+    except KeyError:
+      digest = blake2b(self._glyph(ind).tobytes(),
+                       digest_size=16).digest()
+      self._fingerprints[ind] = digest
+      return digest
+
+  def metrics(self, ind):
+    """ metrics.Metrics of character ind: the box around its pixels and its
+        advance for proportional spacing """
+    ind = self._index(ind)
+    try:
+      return self._metrics[ind]
+    except KeyError:
+      if not self._has(ind):
+        return blank_metrics(self._cols)
+      m = glyph_metrics(self._glyph(ind), self._cols)
+      self._metrics[ind] = m
+      return m
+
+  def all_metrics(self):
+    """ Metrics of every character as a list.  Any not already known are
+        worked out together in one pass over the font, after that only
+        characters changed since are looked at again. """
+    missing = [i for i in self.populated() if i not in self._metrics]
+    if missing:
+      found = batch_metrics([self._glyph(i) for i in missing], self._rows,
+                            self._cols)
+      self._metrics.update(zip(missing, found))
+    result = [blank_metrics(self._cols)] * self._count
+    for i in self.populated():
+      result[i] = self._metrics[i]
+    return result
+
+  def font_fingerprint(self):
+    """ Digest of the size and pixels of the whole font """
+    h = blake2b(digest_size=16)
+    h.update(b"%d:%d:%d:" % (self._rows, self._cols, self._count))
+    for i, g in self.glyphs():
+      h.update(b"%d:" % i)
+      h.update(g)
+    return h.hexdigest()
 
   rows = property(get_rows, set_rows)
   cols = property(get_cols, set_cols)
@@ -0,0 +1,100 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Long running work (saving, exporting) done on a worker thread so the
+## window keeps redrawing.  The worker never touches GTK, progress and the
+## result are handed back to the main loop with GLib.idle_add.
+##
+## The function run gets the Job as its first argument and should call
+## job.progress() now and then, which raises Cancelled once cancel() has
+## been called so the work stops at the next convenient point.
+##
+
+import threading
+
+from gi.repository import GLib
+
+class Cancelled(Exception):
+  pass
+
+class Job:
+  """ Run func(job, *args) on a worker thread.
+
+      on_progress(fraction) and on_done(result, error) are called on the
+      main loop, error is None if func returned normally, the exception it
+      raised otherwise (Cancelled if it was cancelled). """
+  def __init__(self, func, args=(), on_progress=None, on_done=None):
+    self.on_progress = on_progress
+    self.on_done = on_done
+    self.fraction = 0.0
+    self._reported = -1.0
+    self._cancelled = threading.Event()
+    self.thread = threading.Thread(target=self._run, args=(func, args),
+                                   daemon=True)
+
+  def start(self):
+    self.thread.start()
+    return self
+
+  def _run(self, func, args):
+    result = None
+    error = None
+    try:
+      result = func(self, *args)
+    except Exception as e:
+      error = e
+    GLib.idle_add(self._finish, result, error)
+
+  def _finish(self, result, error):
+    if self.on_done is not None:
+      self.on_done(result, error)
+    return False
+
+  def _report(self, fraction):
+    if self.on_progress is not None:
+      self.on_progress(fraction)
+    return False
+
+  def progress(self, fraction=None):
+    """ Called from the worker with the fraction done, or None if it isn't
+        known.  Raises Cancelled if the job has been cancelled. """
+    if self._cancelled.is_set():
+      raise Cancelled()
+    if fraction is None:
+      GLib.idle_add(self._report, None)
+      return
+    self.fraction = fraction
+    # don't flood the main loop, a percent at a time is plenty
+    if (fraction - self._reported >= 0.01) or (fraction >= 1.0):
+      self._reported = fraction
+      GLib.idle_add(self._report, fraction)
+
+  def cancel(self):
+    self._cancelled.set()
+
+  @property
+  def cancelled(self):
+    return self._cancelled.is_set()
+
+  def running(self):
+    return self.thread.is_alive()
+
+  def wait(self, timeout=None):
+    self.thread.join(timeout)
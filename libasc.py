@@ -280,6 +280,19 @@ asc_desc[254] = ""
 asc_desc[255] = ""
 
 
+def char_labels(c):
+  """ (character, description) to show for character number c, from the
+      tables above for the first 256 and the Unicode database after """
+  if c < len(asc_char):
+    return asc_char[c], asc_desc[c]
+  import unicodedata
+  ch = chr(c)
+  name = unicodedata.name(ch, None)
+  name = name.capitalize() if name else "U+%04X" % c
+  if unicodedata.category(ch) in ("Cc", "Cs", "Co", "Cn"):
+    ch = "?"
+  return ch, name
+
 if __name__ == "__main__":
   for i in range(256):
     print(asc_char[i], end='')
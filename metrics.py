@@ -0,0 +1,113 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Glyph metrics: the box around the pixels set in a glyph and how far to
+## move along after drawing it, for proportional spacing.
+##
+##   left, top      blank columns / rows before the ink
+##   width, height  size of the ink box, 0 for a blank glyph
+##   advance        width + SPACING, or the advance of a space for a blank
+##                  glyph
+##
+## Font.metrics() caches these per character.  Working out a whole font's
+## worth is done a row position at a time across every glyph, each row of
+## every glyph as a lane of one big integer, rather than a loop per row.
+##
+
+import sys
+from array import array
+from collections import namedtuple
+
+Metrics = namedtuple("Metrics", "left top width height advance")
+
+# blank columns after each glyph
+SPACING = 1
+
+# below this many glyphs the per glyph version is quicker
+BATCH_MIN = 64
+
+# byte -> 1 if any bit is set
+_NONZERO = bytes([0]) + bytes([1]) * 255
+
+def blank_metrics(cols):
+  """ Metrics of a blank glyph, a space a third of the cell wide (and at
+      least a pixel) """
+  return Metrics(0, 0, 0, 0, max(1, cols // 3))
+
+def _trailing_zeros(v):
+  return (v & -v).bit_length() - 1
+
+def _from_masks(colmask, rowmask, cols):
+  """ Metrics from the OR of a glyph's rows and the bitmask (bit j for row
+      j) of its rows with pixels set """
+  left = cols - colmask.bit_length()
+  width = cols - left - _trailing_zeros(colmask)
+  top = _trailing_zeros(rowmask)
+  return Metrics(left, top, width, rowmask.bit_length() - top,
+                 width + SPACING)
+
+def glyph_metrics(rows, cols):
+  """ Metrics of one glyph given as packed rows """
+  colmask = 0
+  rowmask = 0
+  for j, r in enumerate(rows):
+    if r:
+      colmask |= r
+      rowmask |= 1 << j
+  if not colmask:
+    return blank_metrics(cols)
+  return _from_masks(colmask, rowmask, cols)
+
+def batch_metrics(glyphs, rows, cols):
+  """ Metrics of a list of glyphs, each an array of rows packed the same as
+      Font stores them.  Returns a list in the same order. """
+  if len(glyphs) < BATCH_MIN:
+    return [glyph_metrics(g, cols) for g in glyphs]
+  n = len(glyphs)
+  first = glyphs[0]
+  data = array(first.typecode if isinstance(first, array) else first.format)
+  for g in glyphs:
+    data.frombytes(memoryview(g).cast("B"))
+  width = data.itemsize
+  order = sys.byteorder
+  # the low byte of each lane, where a 0/1 flag ends up
+  low = 0 if order == "little" else width - 1
+
+  colmask = 0
+  rowmask = 0
+  for j in range(rows):
+    lane = data[j::rows].tobytes()
+    colmask |= int.from_bytes(lane, order)
+    # 1 in the low byte of each lane with any bit set
+    flags = lane.translate(_NONZERO)
+    any_set = bytearray(n * width)
+    spread = 0
+    for k in range(width):
+      any_set[low::width] = flags[k::width]
+      spread |= int.from_bytes(any_set, order)
+    rowmask |= spread << j
+
+  colmasks = array(data.typecode)
+  colmasks.frombytes(colmask.to_bytes(n * width, order))
+  rowmasks = array(data.typecode)
+  rowmasks.frombytes(rowmask.to_bytes(n * width, order))
+  blank = blank_metrics(cols)
+  return [_from_masks(c, r, cols) if c else blank
+          for c, r in zip(colmasks, rowmasks)]
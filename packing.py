@@ -0,0 +1,284 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+##
+## Bit packing shared by the exporters.
+##
+## The font already holds one integer per row of pixels, these functions
+## turn a whole font's worth of rows into bytes in a handful of bulk
+## operations rather than a Python loop per pixel.  NumPy is used for big
+## buffers if it's installed, otherwise everything is done with big integer
+## arithmetic and extended slicing on bytes which is nearly as quick.
+##
+
+import sys
+from array import array
+
+from internal_font_class import row_array
+
+# NumPy only pays off on big buffers, it's imported the first time one is
+# packed so the editor doesn't load it at start up
+NUMPY_MIN_ROWS = 4096
+_numpy = None
+
+def _load_numpy():
+  global _numpy
+  if _numpy is None:
+    try:
+      import numpy
+      _numpy = numpy
+    except ImportError:
+      _numpy = False
+  return _numpy
+
+# byte value with its bits in the opposite order, for LSB first output
+REVERSE = bytes(int("{:08b}".format(i)[::-1], 2) for i in range(256))
+
+def row_bytes(cols):
+  """ Number of bytes needed to hold a row cols pixels wide """
+  return (cols + 7) // 8
+
+def pack_rows(rows, cols, msb_first=True, align="left", stride=None):
+  """ Convert a sequence of packed row integers (as held by Font) to bytes.
+
+      msb_first - the left most pixel of each byte is in bit 7, otherwise
+                  the left most pixel is in bit 0.
+      align     - "left" puts the first pixel of the row in the first bit of
+                  the first byte and pads at the end, "right" pads at the
+                  start so the last pixel is in the last bit.
+      stride    - bytes per row in the output, defaults to the minimum
+                  row_bytes(cols).  Any extra bytes are zero.
+
+      Returns bytes of len(rows) * stride. """
+  nbytes = row_bytes(cols)
+  if stride is None:
+    stride = nbytes
+  if stride < nbytes:
+    raise ValueError("stride of %d bytes is too small for %d columns" %
+                     (stride, cols))
+  if align not in ("left", "right"):
+    raise ValueError("align must be 'left' or 'right'")
+  shift = nbytes * 8 - cols if align == "left" else 0
+
+  if not isinstance(rows, array):
+    rows = row_array(rows)
+
+  if (len(rows) >= NUMPY_MIN_ROWS) and _load_numpy():
+    return _pack_numpy(rows, nbytes, shift, msb_first, stride)
+
+  # big endian copy of the rows so each row is itemsize bytes with the
+  # pixels in the bottom cols bits
+  width = rows.itemsize
+  data = array(rows.typecode, rows)
+  if sys.byteorder == "little":
+    data.byteswap()
+  data = data.tobytes()
+
+  if shift:
+    # shifting the whole buffer as one integer shifts every row in place,
+    # none of the rows have bits in the top shift bits to carry over
+    data = (int.from_bytes(data, "big") << shift).to_bytes(len(data), "big")
+
+  # keep the low nbytes of each row
+  out = bytearray(len(rows) * stride)
+  for j in range(nbytes):
+    out[j::stride] = data[width - nbytes + j::width]
+
+  if not msb_first:
+    out = out.translate(REVERSE)
+  return bytes(out)
+
+def _pack_numpy(rows, nbytes, shift, msb_first, stride):
+  numpy = _numpy
+  width = rows.itemsize
+  data = numpy.frombuffer(rows, dtype="=u%d" % width)
+  if shift:
+    data = data << numpy.array(shift, dtype=data.dtype)
+  data = data.astype(">u%d" % width).view(numpy.uint8).reshape(-1, width)
+  data = data[:, width - nbytes:]
+  if not msb_first:
+    data = numpy.frombuffer(REVERSE, dtype=numpy.uint8)[data]
+  if stride != nbytes:
+    padded = numpy.zeros((data.shape[0], stride), dtype=numpy.uint8)
+    padded[:, :nbytes] = data
+    data = padded
+  return data.tobytes()
+
+def pack_font(font, msb_first=True, align="left", stride=None):
+  """ Pack every row of every character in font, see pack_rows for the
+      options.  Character i is at [i * font.rows * stride:
+      (i + 1) * font.rows * stride] in the result. """
+  return pack_rows(font.packed_data(), font.cols, msb_first, align, stride)
+
+## Other layouts.  The font is packed in rows once, then cut into blocks
+## of 8 rows by 8 columns (8 bytes) and every block is transposed at once,
+## with the three masked swaps of Hacker's Delight's transpose8 done on the
+## whole font as one big int.  Each layout is then a reordering of the
+## transposed bytes done with slice assignments.
+##
+##   rows     each row of a character in row_bytes(cols) bytes, the left
+##            most pixel in the top bit, the same as pack_font
+##   columns  each column, left to right, in row_bytes(rows) bytes, the
+##            top pixel in the top bit
+##   pages    SSD1306 style, the character cut into pages 8 rows high,
+##            each page is one byte per column left to right with the top
+##            pixel in bit 0
+
+LAYOUTS = ("rows", "columns", "pages")
+
+# (shift, mask) for the swaps transposing an 8 x 8 bit block held in 8
+# bytes, the first byte is the top row with its left most pixel in bit 7
+_TRANSPOSE8 = ((7, bytes.fromhex("00AA00AA00AA00AA")),
+               (14, bytes.fromhex("0000CCCC0000CCCC")),
+               (28, bytes.fromhex("00000000F0F0F0F0")))
+
+def transpose_blocks(data):
+  """ Transpose every 8 x 8 bit block of data (a multiple of 8 bytes long,
+      one byte per row of a block).  The masks keep every swap inside its
+      block so the whole buffer is done in a few big int operations. """
+  if not data:
+    return b""
+  blocks = len(data) // 8
+  x = int.from_bytes(data, "big")
+  for shift, mask in _TRANSPOSE8:
+    m = int.from_bytes(mask * blocks, "big")
+    t = (x ^ (x >> shift)) & m
+    x ^= t ^ (t << shift)
+  return x.to_bytes(len(data), "big")
+
+def layout_size(layout, rows, cols):
+  """ Bytes per character in layout """
+  if layout == "rows":
+    return rows * row_bytes(cols)
+  return cols * row_bytes(rows)
+
+def column_bytes(data, chars, rows, cols):
+  """ Each character of data (from pack_font) cut into bands of 8 rows,
+      the last one padded with blank pixels, and each band turned on its
+      side: byte x of a band is column x, the top pixel in bit 7.  A band
+      takes row_bytes(cols) * 8 bytes, band p of character c is number
+      c * row_bytes(rows) + p. """
+  width = row_bytes(cols)
+  height = row_bytes(rows) * 8
+  if height != rows:
+    padded = bytearray(chars * height * width)
+    for k in range(rows * width):
+      padded[k::height * width] = data[k::rows * width]
+    data = padded
+  # gather the 8 rows of each block together, byte k of block j of a band
+  # is row k of the band's byte j
+  band = width * 8
+  blocks = bytearray(len(data))
+  for j in range(width):
+    for k in range(8):
+      blocks[j * 8 + k::band] = data[k * width + j::band]
+  return transpose_blocks(blocks)
+
+def pack_layouts(font, layouts=LAYOUTS, msb_first=True):
+  """ font packed in each of layouts.  Returns a dict of layout -> bytes,
+      character i of each at [i * size:(i + 1) * size] where size is
+      layout_size().  msb_first=False reverses the bits of every byte of
+      the rows and columns layouts. """
+  for layout in layouts:
+    if layout not in LAYOUTS:
+      raise ValueError("unknown layout %r" % layout)
+  data = pack_font(font)
+  packed = {}
+  if "rows" in layouts:
+    packed["rows"] = data if msb_first else data.translate(REVERSE)
+  if ("columns" in layouts) or ("pages" in layouts):
+    chars = font.chars
+    cols = font.cols
+    pages = row_bytes(font.rows)
+    band = row_bytes(cols) * 8
+    bands = column_bytes(data, chars, font.rows, cols)
+    if "columns" in layouts:
+      out = bytearray(chars * cols * pages)
+      for x in range(cols):
+        for p in range(pages):
+          out[x * pages + p::cols * pages] = bands[p * band + x::pages * band]
+      packed["columns"] = bytes(out if msb_first else
+                                out.translate(REVERSE))
+    if "pages" in layouts:
+      out = bytearray(chars * cols * pages)
+      for x in range(cols):
+        out[x::cols] = bands[x::band]
+      packed["pages"] = out.translate(REVERSE)
+  return packed
+
+## Progress.  An exporter that takes a progress keyword (see
+## exporter_registry.py) is given a callback taking the fraction done,
+## which raises to stop the export if it's been cancelled.
+
+# characters between progress reports in a loop over the font
+PROGRESS_EVERY = 1024
+
+def report_progress(progress, done, total):
+  """ Tell progress, if there is one, the fraction done """
+  if progress is not None:
+    progress(done / total if total else 1.0)
+
+def progress_part(progress, start, end):
+  """ A progress callback for one stage of a longer job, its 0 to 1 is
+      start to end of progress """
+  if progress is None:
+    return None
+  return lambda fraction: progress(start + (end - start) * fraction)
+
+def c_escaped(data):
+  """ Format bytes as a C string body, every byte as \\xHH.  Each byte
+      takes exactly four characters so the result can be sliced up per
+      character. """
+  if not data:
+    return ""
+  return ("\\x" + data.hex(":").upper()).replace(":", "\\x")
+
+def c_hex_list(data):
+  """ Format bytes as the body of a C array initialiser, every byte as
+      "0xHH, " so each byte takes exactly six characters. """
+  if not data:
+    return ""
+  return "0x" + data.hex(":").upper().replace(":", ", 0x") + ", "
+
+def c_layout_source(font, layouts=LAYOUTS, name="font", msb_first=True,
+                    progress=None):
+  """ C source with font in each of layouts, as arrays called
+      name_<layout> of one row per character, all from one decoded copy
+      of the font (see pack_layouts).  progress is told how far through
+      the characters it is. """
+  packed = pack_layouts(font, layouts, msb_first)
+  out = ["/* %d characters, %d x %d pixels */\n" % (font.chars, font.cols,
+                                                     font.rows),
+         "#include <stdint.h>\n\n"]
+  for n, layout in enumerate(layouts):
+    part = progress_part(progress, n / len(layouts), (n + 1) / len(layouts))
+    size = layout_size(layout, font.rows, font.cols)
+    text = c_hex_list(packed[layout])
+    step = size * 6
+    out.append("const uint8_t %s_%s[%d][%d] = {\n" % (name, layout,
+                                                     font.chars, size))
+    for i in range(font.chars):
+      if i % PROGRESS_EVERY == 0:
+        report_progress(part, i, font.chars)
+      if (i >= 32) and (i < 127):
+        comm = "  /* %c */" % i
+      else:
+        comm = ""
+      out.append("  {%s},%s\n" % (text[i * step:(i + 1) * step - 2], comm))
+    out.append("};\n\n")
+  return "".join(out)
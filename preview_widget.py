@@ -0,0 +1,137 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+import sys
+import gi
+
+gi.require_version('Gtk', '3.0')
+
+from gi.repository import Gtk
+from gi.repository import GObject
+import cairo
+from render import TextRenderer, SAMPLE
+from profiling import traced
+
+# bit order of cairo's 1 bit surfaces follows the machine
+A1_MSB_FIRST = sys.byteorder == "big"
+
+class PreviewWidget(Gtk.VBox):
+  """ Sample text set in the font being edited.  The text is rendered by
+      render.TextRenderer into a single 1 bit mask, when characters are
+      updated only the lines using them are rendered again. """
+  def __init__(self):
+    GObject.GObject.__init__(self)
+
+    self.font = None
+    self.renderer = None
+    self.mask = None
+    self.mag = 1
+    self.fg = (1.0, 1.0, 1.0)
+    self.bg = (0.0, 0.0, 0.0)
+
+    hl = Gtk.HBox()
+    self.text_entry = Gtk.Entry()
+    self.text_entry.set_text(SAMPLE.split("\n")[0])
+    self.text_entry.connect("changed", self.text_changed_cb)
+    self.proportional_btn = Gtk.CheckButton.new_with_mnemonic(
+                              "P_roportional")
+    self.proportional_btn.connect("toggled", self.proportional_cb)
+    hl.pack_start(Gtk.Label(label="Preview:"), False, True, 4)
+    hl.pack_start(self.text_entry, True, True, 0)
+    hl.pack_start(self.proportional_btn, False, True, 4)
+    self.pack_start(hl, False, True, 0)
+
+    self.scroll = Gtk.ScrolledWindow()
+    self.scroll.set_policy(Gtk.PolicyType.AUTOMATIC, Gtk.PolicyType.NEVER)
+    self.drawing = Gtk.DrawingArea()
+    self.drawing.connect("draw", self.expose)
+    self.scroll.add(self.drawing)
+    self.pack_start(self.scroll, False, True, 0)
+
+  def set_font(self, font):
+    """ Show the text in font, a newly opened or created one """
+    self.font = font
+    self.checkpoint = font.checkpoint()
+    self.fg = (font.fg['r'] / 65535, font.fg['g'] / 65535,
+               font.fg['b'] / 65535)
+    self.bg = (font.bg['r'] / 65535, font.bg['g'] / 65535,
+               font.bg['b'] / 65535)
+    self.mag = font.scale
+    self.renderer = TextRenderer(font, self.text_entry.get_text(),
+                                 proportional=self.proportional_btn.get_active())
+    self.redraw()
+
+  def refresh(self):
+    """ Render again the lines using characters modified in the font since
+        the last refresh """
+    for c in self.font.modified_since(self.checkpoint):
+      self.renderer.glyph_changed(c)
+    self.checkpoint = self.font.checkpoint()
+    self.redraw()
+
+  @traced("PreviewWidget.redraw")
+  def redraw(self):
+    fb = self.renderer.render()
+    if fb.width and fb.height:
+      stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_A1,
+                                                          fb.width)
+      data = bytearray(fb.tobytes(stride, A1_MSB_FIRST))
+      self.mask = cairo.ImageSurface.create_for_data(data, cairo.FORMAT_A1,
+                                                     fb.width, fb.height,
+                                                     stride)
+    else:
+      self.mask = None
+    # room for a scroll bar under the text
+    self.drawing.set_size_request(fb.width * self.mag + 4,
+                                  fb.height * self.mag + 4)
+    self.scroll.set_size_request(-1, fb.height * self.mag + 24)
+    self.drawing.queue_draw()
+
+  def expose(self, area, context):
+    context.set_source_rgb(*self.bg)
+    context.paint()
+    if self.mask is None:
+      return True
+    context.translate(2, 2)
+    context.scale(self.mag, self.mag)
+    pattern = cairo.SurfacePattern(self.mask)
+    pattern.set_filter(cairo.FILTER_NEAREST)
+    context.set_source_rgb(*self.fg)
+    context.mask(pattern)
+    return True
+
+  def text_changed_cb(self, *kw):
+    if self.renderer is not None:
+      self.renderer.set_text(self.text_entry.get_text())
+      self.redraw()
+
+  def proportional_cb(self, *kw):
+    if self.font is not None:
+      self.set_font(self.font)
+
+  def set_colours(self, fr, fg, fb, br, bg, bb):
+    self.fg = (fr / 65535, fg / 65535, fb / 65535)
+    self.bg = (br / 65535, bg / 65535, bb / 65535)
+    self.drawing.queue_draw()
+
+  def set_scale(self, scale):
+    if scale != self.mag:
+      self.mag = scale
+      if self.renderer is not None:
+        self.redraw()
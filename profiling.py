@@ -0,0 +1,156 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Opt in timing of the slow paths, for when someone reports fontedit being
+## slow.  Switched on with
+##
+##   FONTEDIT_PROFILE=trace.json fontedit ...
+##   fontedit --profile[=trace.json] ...
+##
+## (FONTEDIT_PROFILE=1 or a bare --profile write fontedit-<pid>.json.)
+## Functions decorated with traced() record a span each call, with a call
+## count and the peak memory of the process so far.  At exit everything is
+## written as Chrome trace JSON, open it in chrome://tracing or
+## https://ui.perfetto.dev, and a summary is printed on stderr.
+##
+## When profiling is off traced() hands back the function it was given so
+## there is nothing in the call path at all.  That means it has to be
+## switched on before the modules using it are imported.
+##
+## Exports run in worker processes (fontedit export -j) aren't recorded,
+## use -j 1 to see them.
+##
+
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+DEFAULT_FILE = "fontedit-%d.json"
+
+_events = None
+_counts = {}
+_totals = {}
+_filename = None
+_origin = 0
+_peak = 0
+
+def enabled():
+  return _events is not None
+
+def enable(filename=None):
+  """ Start recording, the trace is written to filename at exit """
+  global _events, _filename, _origin
+  _filename = filename or DEFAULT_FILE % os.getpid()
+  if _events is None:
+    _events = []
+    _origin = time.perf_counter_ns()
+    atexit.register(write)
+
+def peak_memory():
+  """ Peak resident size of the process in KiB, 0 if it can't be found """
+  if resource is None:
+    return 0
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # bytes on macOS, KiB everywhere else
+  return peak // 1024 if sys.platform == "darwin" else peak
+
+def _record(name, start, end):
+  global _peak
+  _counts[name] = _counts.get(name, 0) + 1
+  _totals[name] = _totals.get(name, 0) + end - start
+  _events.append({"name": name, "ph": "X", "pid": os.getpid(),
+                  "tid": threading.get_ident(),
+                  "ts": (start - _origin) / 1000,
+                  "dur": (end - start) / 1000})
+  peak = peak_memory()
+  if peak > _peak:
+    _peak = peak
+    _events.append({"name": "peak memory", "ph": "C", "pid": os.getpid(),
+                    "ts": (end - _origin) / 1000, "args": {"KiB": peak}})
+
+@contextlib.contextmanager
+def span(name):
+  """ Time the with block as name, if profiling is on """
+  if _events is None:
+    yield
+    return
+  start = time.perf_counter_ns()
+  try:
+    yield
+  finally:
+    _record(name, start, time.perf_counter_ns())
+
+def wrap(func, name=None):
+  """ func timed as name (default its qualified name) if profiling is on,
+      otherwise func itself """
+  if _events is None:
+    return func
+  name = name or func.__qualname__
+
+  @functools.wraps(func)
+  def timed(*args, **kwargs):
+    start = time.perf_counter_ns()
+    try:
+      return func(*args, **kwargs)
+    finally:
+      _record(name, start, time.perf_counter_ns())
+  return timed
+
+def traced(name=None):
+  """ Decorator form of wrap() """
+  return lambda func: wrap(func, name)
+
+def summary():
+  """ Text table of calls and time per span name, slowest first """
+  lines = ["%-40s %8s %12s %12s" % ("span", "calls", "total ms", "mean ms")]
+  for name in sorted(_totals, key=_totals.get, reverse=True):
+    total = _totals[name] / 1e6
+    lines.append("%-40s %8d %12.2f %12.3f" % (name, _counts[name], total,
+                                             total / _counts[name]))
+  lines.append("peak memory %d KiB" % max(_peak, peak_memory()))
+  return "\n".join(lines)
+
+def write(filename=None):
+  """ Write the trace recorded so far """
+  if _events is None:
+    return
+  filename = filename or _filename
+  trace = {"traceEvents": _events, "displayTimeUnit": "ms",
+           "otherData": {"counts": _counts,
+                         "total_ms": {k: v / 1e6 for k, v in _totals.items()},
+                         "peak_memory_kib": max(_peak, peak_memory())}}
+  with open(filename, "w") as fw:
+    json.dump(trace, fw)
+  print(summary(), file=sys.stderr)
+  print("profile written to %s" % filename, file=sys.stderr)
+
+if os.environ.get("FONTEDIT_PROFILE"):
+  _env = os.environ["FONTEDIT_PROFILE"]
+  enable(None if _env == "1" else _env)
@@ -0,0 +1,306 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Text rendering without GTK, for previews and for checking fonts in CI:
+##
+##   python3 render.py font.fnt --text "The quick brown fox" -o fox.png
+##   python3 render.py --text-file sample.txt --width 320 -o shots/ *.fnt
+##
+## A framebuffer is a list of rows, each row one integer with the left
+## most pixel in the top bit, the same as the rows of a glyph.  Drawing a
+## glyph is then a shift and an OR per row of the glyph, however wide the
+## framebuffer.
+##
+## Output is a 1 bit PNG or PBM, written with nothing but zlib so it's the
+## same byte for byte on every machine and can be compared directly.
+##
+
+import os
+import struct
+import sys
+import zlib
+
+from packing import REVERSE
+
+# drawn for characters the font doesn't have
+MISSING = ord("?")
+
+class Framebuffer:
+  """ A 1 bit image, rows[y] holds row y with pixel x in bit
+      width - 1 - x """
+  def __init__(self, width, height):
+    self.width = width
+    self.height = height
+    self.rows = [0] * height
+
+  def pixel(self, x, y):
+    return (self.rows[y] >> (self.width - 1 - x)) & 1
+
+  def blit(self, rows, x, y, cols):
+    """ OR a glyph given as packed rows cols wide into the image with its
+        top left corner at x, y.  Anything outside the image is clipped. """
+    if (y < 0) or (y + len(rows) > self.height):
+      rows = rows[max(-y, 0):max(self.height - y, 0)]
+      y = max(y, 0)
+    out = self.rows
+    shift = self.width - x - cols
+    if (x >= 0) and (shift >= 0):
+      for j, r in enumerate(rows, y):
+        if r:
+          out[j] |= r << shift
+    else:
+      # partly outside, what's off the right goes with the shift and what's
+      # off the left with the mask
+      mask = (1 << self.width) - 1
+      for j, r in enumerate(rows, y):
+        if r:
+          out[j] |= (r << shift if shift >= 0 else r >> -shift) & mask
+
+  def scaled(self, scale):
+    """ A copy scale times bigger, each pixel a scale x scale block """
+    if scale == 1:
+      return self
+    big = Framebuffer(self.width * scale, self.height * scale)
+    rows = []
+    for r in self.rows:
+      bits = format(r, "0%db" % self.width) if self.width else ""
+      bits = bits.replace("0", "a").replace("1", "b")
+      bits = bits.replace("a", "0" * scale).replace("b", "1" * scale)
+      rows += [int(bits or "0", 2)] * scale
+    big.rows = rows
+    return big
+
+  def tobytes(self, stride=None, msb_first=True):
+    """ The image packed 8 pixels to a byte, each row padded to stride
+        bytes (default the least that fits) """
+    nbytes = (self.width + 7) // 8
+    stride = stride or nbytes
+    pad = nbytes * 8 - self.width
+    tail = bytes(stride - nbytes)
+    data = b"".join((r << pad).to_bytes(nbytes, "big") + tail
+                    for r in self.rows)
+    return data if msb_first else data.translate(REVERSE)
+
+  def _check_size(self):
+    if not (self.width and self.height):
+      raise ValueError("can't write a %d x %d image" % (self.width,
+                                                         self.height))
+
+  def pbm(self):
+    """ The image as a binary PBM, set pixels black """
+    self._check_size()
+    return b"P4\n%d %d\n" % (self.width, self.height) + self.tobytes()
+
+  def png(self, fg=(0, 0, 0), bg=(255, 255, 255)):
+    """ The image as a 1 bit PNG, set pixels fg, the rest bg """
+    def chunk(kind, data):
+      return (struct.pack(">I", len(data)) + kind + data +
+              struct.pack(">I", zlib.crc32(kind + data)))
+    self._check_size()
+    nbytes = (self.width + 7) // 8
+    data = self.tobytes()
+    lines = b"".join(b"\0" + data[k:k + nbytes]
+                     for k in range(0, len(data), nbytes))
+    return (b"\x89PNG\r\n\x1a\n" +
+            chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height,
+                                       1, 3, 0, 0, 0)) +
+            chunk(b"PLTE", bytes(bg) + bytes(fg)) +
+            chunk(b"IDAT", zlib.compress(lines)) +
+            chunk(b"IEND", b""))
+
+  def save(self, filename, fg=(0, 0, 0), bg=(255, 255, 255)):
+    """ Write a .pbm or (anything else) .png file """
+    if filename.lower().endswith(".pbm"):
+      data = self.pbm()
+    else:
+      data = self.png(fg, bg)
+    with open(filename, "wb") as fw:
+      fw.write(data)
+
+class TextRenderer:
+  """ Lays out text in a font and renders it.  Lines are kept once
+      rendered, glyph_changed() throws away just the lines using a
+      character so an edit re-renders only what it touches.
+
+      proportional spaces characters by their metrics (see metrics.py)
+      rather than the cell width.  width, if given, wraps lines at spaces
+      to fit. """
+  def __init__(self, font, text, width=None, proportional=False,
+               line_spacing=0):
+    self.font = font
+    self.text = text
+    self.width = width
+    self.proportional = proportional
+    self.line_spacing = line_spacing
+    self.layout()
+
+  def set_text(self, text):
+    self.text = text
+    self.layout()
+
+  def _char(self, ch):
+    c = ord(ch)
+    if c < self.font.chars:
+      return c
+    return MISSING if MISSING < self.font.chars else None
+
+  def _advance(self, c):
+    if self.proportional:
+      return self._metrics[c].advance
+    return self.font.cols
+
+  def layout(self):
+    """ Work out where every character goes, each line is a list of
+        (character, x) """
+    self._metrics = self.font.all_metrics() if self.proportional else None
+    self.lines = []
+    for para in self.text.split("\n"):
+      line = []
+      x = 0
+      # start of the last word on the line, where it can be broken
+      word = 0
+      for ch in para:
+        c = self._char(ch)
+        if c is None:
+          continue
+        advance = self._advance(c)
+        if ch == " ":
+          word = len(line) + 1
+        elif self.width and x + advance > self.width and line:
+          if 0 < word < len(line):
+            # move the word on to a new line
+            rest = line[word:]
+            self.lines.append(line[:word])
+            shift = rest[0][1]
+            line = [(r, rx - shift) for r, rx in rest]
+            x -= shift
+          else:
+            self.lines.append(line)
+            line = []
+            x = 0
+          word = 0
+        line.append((c, x))
+        x += advance
+      self.lines.append(line)
+    self.text_width = max((line[-1][1] + self._advance(line[-1][0])
+                           for line in self.lines if line), default=0)
+    self.rendered = [None] * len(self.lines)
+
+  @property
+  def size(self):
+    """ (width, height) of the rendered text """
+    height = len(self.lines) * (self.font.rows + self.line_spacing)
+    width = self.width or self.text_width
+    return width, max(height - self.line_spacing, 0)
+
+  def _render_line(self, line, width):
+    """ The rows of one line of text, each glyph blitted into place """
+    font = self.font
+    fb = Framebuffer(width, font.rows)
+    for c, x in line:
+      if self.proportional:
+        x -= self._metrics[c].left
+      fb.blit(font._glyph(c), x, 0, font.cols)
+    return fb.rows
+
+  def render(self):
+    """ The text as a Framebuffer, only lines not already rendered are
+        drawn.  It's at least 1 x 1 so empty text still makes an image. """
+    width, height = self.size
+    fb = Framebuffer(max(width, 1), max(height, 1))
+    step = self.font.rows + self.line_spacing
+    for n, line in enumerate(self.lines):
+      if self.rendered[n] is None:
+        self.rendered[n] = self._render_line(line, width)
+      fb.rows[n * step:n * step + self.font.rows] = self.rendered[n]
+    return fb
+
+  def glyph_changed(self, c):
+    """ Character c of the font has changed """
+    if self.proportional:
+      old = self._metrics[c]
+      new = self.font.metrics(c)
+      self._metrics[c] = new
+      if (old.advance, old.left) != (new.advance, new.left):
+        # moves everything after it
+        if any(c == d for line in self.lines for d, x in line):
+          self.layout()
+        return
+    for n, line in enumerate(self.lines):
+      if any(c == d for d, x in line):
+        self.rendered[n] = None
+
+def render_text(font, text, width=None, proportional=False, line_spacing=0):
+  """ text rendered in font, a Framebuffer """
+  return TextRenderer(font, text, width, proportional, line_spacing).render()
+
+SAMPLE = ("The quick brown fox jumps over the lazy dog.\n"
+          "THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG!\n"
+          "0123456789 #$%&'()*+,-./:;<=>?@[\\]^_`{|}~")
+
+def main(argv):
+  import argparse
+  from fontfile import load_font
+
+  parser = argparse.ArgumentParser(
+              description="Render sample text in fonts to PNG or PBM.")
+  parser.add_argument("fonts", nargs="+", metavar="FONT")
+  parser.add_argument("--text", "-t", help="text to render, \\n for a new "
+                      "line (default a pangram and the ASCII symbols)")
+  parser.add_argument("--text-file", help="read the text from a file")
+  parser.add_argument("--output", "-o", required=True,
+              help="output file, or a directory to write one image per font "
+                   "into")
+  parser.add_argument("--format", choices=("png", "pbm"), default="png",
+              help="image format for --output directories")
+  parser.add_argument("--width", type=int,
+              help="wrap lines to this many pixels")
+  parser.add_argument("--proportional", "-p", action="store_true",
+              help="space characters by their width rather than the cell")
+  parser.add_argument("--line-spacing", type=int, default=0,
+              help="blank rows between lines")
+  parser.add_argument("--scale", type=int, default=1,
+              help="magnify the output")
+  args = parser.parse_args(argv)
+
+  if args.text_file:
+    with open(args.text_file, encoding="utf-8") as fr:
+      text = fr.read().rstrip("\n")
+  elif args.text is not None:
+    text = args.text.replace("\\n", "\n")
+  else:
+    text = SAMPLE
+
+  several = len(args.fonts) > 1 or os.path.isdir(args.output)
+  if several:
+    os.makedirs(args.output, exist_ok=True)
+  for filename in args.fonts:
+    font = load_font(filename)
+    fb = render_text(font, text, args.width, args.proportional,
+                     args.line_spacing).scaled(args.scale)
+    out = args.output
+    if several:
+      out = os.path.join(out, "%s.%s" % (
+              os.path.splitext(os.path.basename(filename))[0], args.format))
+    fb.save(out)
+  return 0
+
+if __name__ == "__main__":
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,177 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Finding identical and nearly identical glyphs.
+##
+## Each glyph is keyed by its rows as one integer, so the number of pixels
+## two glyphs differ by is the popcount of their keys XORed.  Identical
+## glyphs share a key and are found with a dict.
+##
+## For near matches the rows are dealt out into max_distance + 1 bands
+## (row j into band j % bands) and every band of every glyph is hashed.
+## Two glyphs differing in at most max_distance pixels differ in at most
+## that many bands, so at least one band is the same in both: only glyphs
+## sharing a band with the query are candidates, and only those have
+## their distance worked out.  This finds every match, there are no false
+## negatives, without comparing every glyph with every other.
+##
+## Searches wider than the index was built for fall back to looking at
+## every glyph, still only a popcount each.
+##
+
+from array import array
+
+DEFAULT_DISTANCE = 2
+
+try:
+  _popcount = int.bit_count
+except AttributeError:
+  def _popcount(v):
+    return bin(v).count("1")
+
+def glyph_key(rows):
+  """ A glyph's packed rows as one integer """
+  return int.from_bytes(memoryview(rows).cast("B"), "little")
+
+class SimilarityIndex:
+  """ Index of the characters with pixels set in font """
+  def __init__(self, font, max_distance=DEFAULT_DISTANCE):
+    self.font = font
+    self.max_distance = max_distance
+    self.bands = max_distance + 1
+    # character -> key, key -> characters with it, and per band the band
+    # bytes -> characters
+    self.keys = {}
+    self.exact = {}
+    self.tables = [{} for b in range(self.bands)]
+    for i, rows in font.glyphs():
+      self._add(i, rows)
+    self.checkpoint = font.checkpoint()
+
+  def _band_values(self, rows):
+    if not isinstance(rows, array):
+      rows = array(self.font._blank.typecode, rows)
+    return [rows[b::self.bands].tobytes() for b in range(self.bands)]
+
+  def _add(self, i, rows):
+    key = glyph_key(rows)
+    self.keys[i] = key
+    self.exact.setdefault(key, []).append(i)
+    for table, value in zip(self.tables, self._band_values(rows)):
+      table.setdefault(value, []).append(i)
+
+  def _remove(self, i):
+    key = self.keys.pop(i, None)
+    if key is None:
+      return
+    self.exact[key].remove(i)
+    if not self.exact[key]:
+      del self.exact[key]
+    # the band values are worked out from the key again, the font has
+    # already moved on
+    rows = array(self.font._blank.typecode)
+    rows.frombytes(key.to_bytes(len(self.font._blank) * rows.itemsize,
+                                "little"))
+    for table, value in zip(self.tables, self._band_values(rows)):
+      table[value].remove(i)
+      if not table[value]:
+        del table[value]
+
+  def update(self, i):
+    """ Character i of the font has changed """
+    self._remove(i)
+    if not self.font.is_blank(i):
+      self._add(i, self.font._glyph(i))
+
+  def refresh(self):
+    """ Update every character modified since the index was built or last
+        refreshed """
+    for i in self.font.modified_since(self.checkpoint):
+      self.update(i)
+    self.checkpoint = self.font.checkpoint()
+
+  def duplicates(self):
+    """ Groups of identical characters, each a sorted list """
+    return sorted(sorted(g) for g in self.exact.values() if len(g) > 1)
+
+  def similar(self, rows, max_distance=None):
+    """ Characters differing from the glyph given as packed rows in at most
+        max_distance pixels (default the index's), as (distance,
+        character) pairs nearest first """
+    if max_distance is None:
+      max_distance = self.max_distance
+    key = glyph_key(rows if isinstance(rows, array) else
+                    array(self.font._blank.typecode, rows))
+    if max_distance > self.max_distance:
+      candidates = self.keys
+    else:
+      candidates = set()
+      for table, value in zip(self.tables, self._band_values(rows)):
+        candidates.update(table.get(value, ()))
+    keys = self.keys
+    found = []
+    for i in candidates:
+      d = _popcount(keys[i] ^ key)
+      if d <= max_distance:
+        found.append((d, i))
+    found.sort()
+    return found
+
+  def similar_to(self, ind, max_distance=None):
+    """ Characters within max_distance pixels of character ind, not
+        counting ind itself """
+    if self.font.is_blank(ind):
+      return []
+    return [(d, i) for d, i in self.similar(self.font._glyph(ind),
+                                            max_distance) if i != ind]
+
+  def near_duplicates(self, max_distance=None):
+    """ Every pair of characters (a, b, distance), a < b, differing in at
+        most max_distance pixels (no more than the index was built for),
+        identical ones included """
+    if max_distance is None:
+      max_distance = self.max_distance
+    max_distance = min(max_distance, self.max_distance)
+    pairs = {}
+    # identical characters are compared once as a group, by one of them
+    first = {i: group[0] for group in self.exact.values() for i in group}
+    for group in self.exact.values():
+      for k, a in enumerate(group):
+        for b in group[k + 1:]:
+          pairs[min(a, b), max(a, b)] = 0
+    keys = self.keys
+    for table in self.tables:
+      for bucket in table.values():
+        reps = sorted({first[i] for i in bucket})
+        for k, a in enumerate(reps):
+          for b in reps[k + 1:]:
+            if (a, b) in pairs:
+              continue
+            d = _popcount(keys[a] ^ keys[b])
+            if d <= max_distance:
+              pairs[a, b] = d
+    # spread the matches to the rest of each identical group
+    found = set()
+    for (a, b), d in pairs.items():
+      for x in self.exact[keys[a]]:
+        for y in self.exact[keys[b]]:
+          if x != y:
+            found.add((min(x, y), max(x, y), d))
+    return sorted(found)
@@ -0,0 +1,180 @@
+##
+##    This file is part of Fontedit.
+##    Copyright 2010-2020 Nathan Dumont
+##
+##    Fontedit is free software: you can redistribute it and/or modify
+##    it under the terms of the GNU General Public License as published by
+##    the Free Software Foundation, either version 3 of the License, or
+##    (at your option) any later version.
+##
+##    Fontedit is distributed in the hope that it will be useful,
+##    but WITHOUT ANY WARRANTY; without even the implied warranty of
+##    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##    GNU General Public License for more details.
+##
+##    You should have received a copy of the GNU General Public License
+##    along with Fontedit.  If not, see <http://www.gnu.org/licenses/>.
+##
+
+
+##
+## Operations on every glyph of a font, or a range of characters, at once.
+##
+## Every operation here comes down to two things: a function of one
+## packed row, and which row of the old glyph each row of the new one
+## comes from.  The rows of all the glyphs concerned go into one flat
+## array, the row function is worked out once per distinct row value (a
+## font has far fewer of those than rows) and mapped over the array, then
+## rows are moved into place with a slice assignment per row position,
+## covering every glyph together.
+##
+## Changes go into the font in one go so they're tracked like any other
+## (modified_since() lists just the characters that changed) but they're
+## not recorded for undo: the font's history is cleared if anything
+## changed.  Operations that change the size of the characters always
+## apply to the whole font.
+##
+
+from array import array
+
+from internal_font_class import ROW_TYPE
+
+MAX_SIZE = 32
+
+MODES = ("crop", "center", "scale")
+
+def _reverse_bits(cols):
+  return lambda r: int(format(r, "0%db" % cols)[::-1], 2)
+
+def _apply(font, row_func=None, source=None, rows=None, cols=None, start=0,
+           stop=None, blanks=False):
+  """ Transform characters [start, stop) of font.  row_func maps an old row
+      value to a new one, source[y] is the old row new row y comes from
+      (None for a blank row), rows and cols the new size.  blanks says
+      whether blank characters can change.  Returns the set of characters
+      changed. """
+  old_rows = font.rows
+  rows = old_rows if rows is None else rows
+  cols = font.cols if cols is None else cols
+  resized = (rows, cols) != (font.rows, font.cols)
+  if not (0 < rows <= MAX_SIZE and 0 < cols <= MAX_SIZE):
+    raise ValueError("characters can be 1 to %d pixels in each direction" %
+                     MAX_SIZE)
+  if resized and (start, stop) not in ((0, None), (0, font.chars)):
+    raise ValueError("a size change has to apply to the whole font")
+  if stop is None:
+    stop = font.chars
+  if source is None:
+    source = list(range(rows))
+
+  if blanks:
+    chars = list(range(start, stop))
+  else:
+    chars = font.populated(start, stop)
+  data = array(ROW_TYPE)
+  for i in chars:
+    data.frombytes(memoryview(font._glyph(i)).cast("B"))
+
+  if row_func is not None:
+    table = {v: row_func(v) for v in set(data)}
+    data = array(ROW_TYPE, map(table.__getitem__, data))
+
+  out = data
+  if source != list(range(old_rows)):
+    out = array(ROW_TYPE, [0]) * (len(chars) * rows)
+    for y, s in enumerate(source):
+      if s is not None:
+        out[y::rows] = data[s::old_rows]
+
+  new = {}
+  for k, i in enumerate(chars):
+    glyph = out[k * rows:(k + 1) * rows]
+    if resized or glyph != font._glyph(i):
+      new[i] = glyph
+
+  if resized:
+    font.replace_glyphs(rows, cols, new)
+  elif new:
+    font.load_glyphs(new.items())
+  if (resized or new) and font.history is not None:
+    # the history's deltas don't apply to the transformed characters
+    font.history.clear()
+  return set(range(font.chars)) if resized else set(new)
+
+def shift(font, dx=0, dy=0, wrap=False, start=0, stop=None):
+  """ Move pixels dx right and dy down (negative for left and up), pixels
+      moved off one side come back on the other if wrap """
+  cols = font.cols
+  rows = font.rows
+  mask = (1 << cols) - 1
+  if wrap:
+    dx %= cols
+    func = lambda r: ((r >> dx) | (r << (cols - dx))) & mask
+    source = [(y - dy) % rows for y in range(rows)]
+  else:
+    if dx >= 0:
+      func = lambda r: r >> dx
+    else:
+      func = lambda r: (r << -dx) & mask
+    source = [y - dy if 0 <= y - dy < rows else None for y in range(rows)]
+  return _apply(font, func if dx else None, source, start=start, stop=stop)
+
+def invert(font, start=0, stop=None):
+  """ Swap foreground and background """
+  mask = (1 << font.cols) - 1
+  return _apply(font, lambda r: r ^ mask, start=start, stop=stop,
+                blanks=True)
+
+def mirror(font, horizontal=True, start=0, stop=None):
+  """ Flip left to right, or top to bottom if not horizontal """
+  if horizontal:
+    return _apply(font, _reverse_bits(font.cols), start=start, stop=stop)
+  return _apply(font, source=list(range(font.rows))[::-1], start=start,
+                stop=stop)
+
+def embolden(font, start=0, stop=None):
+  """ Thicken strokes by a pixel to the right, the usual way of making a
+      bold bitmap font """
+  return _apply(font, lambda r: r | (r >> 1), start=start, stop=stop)
+
+def reframe(font, rows, cols, top=0, left=0):
+  """ Change the size to rows x cols, moving the pixels top rows down and
+      left columns right (negative crops) """
+  old_cols = font.cols
+  right = cols - old_cols - left
+  mask = (1 << cols) - 1
+  if right >= 0:
+    func = lambda r: (r << right) & mask
+  else:
+    func = lambda r: (r >> -right) & mask
+  source = [y - top if 0 <= y - top < font.rows else None
+            for y in range(rows)]
+  return _apply(font, func if right or left else None, source, rows, cols)
+
+def pad(font, top=0, bottom=0, left=0, right=0):
+  """ Add blank rows and columns around every character """
+  return reframe(font, font.rows + top + bottom, font.cols + left + right,
+                 top, left)
+
+def resize(font, rows, cols, mode="crop"):
+  """ Change the size of the characters.  mode is
+
+        crop    keep the top left, cutting or padding at the right and
+                bottom
+        center  cut or pad evenly on each side
+        scale   nearest neighbour scaling """
+  if mode == "crop":
+    return reframe(font, rows, cols)
+  if mode == "center":
+    return reframe(font, rows, cols, (rows - font.rows) // 2,
+                   (cols - font.cols) // 2)
+  if mode == "scale":
+    old_rows = font.rows
+    old_cols = font.cols
+    picks = [x * old_cols // cols for x in range(cols)]
+    def func(r):
+      bits = format(r, "0%db" % old_cols)
+      return int("".join([bits[k] for k in picks]), 2)
+    source = [y * old_rows // rows for y in range(rows)]
+    return _apply(font, func, source, rows, cols)
+  raise ValueError("unknown resize mode %r" % mode)
@@ -25,17 +25,51 @@ gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk
 from gi.repository import GObject
 from gi.repository import Gdk
-from gi.repository import GdkPixbuf
+from gi.repository import GLib
+from collections import OrderedDict
 from math import floor, ceil, sqrt
+import time
+import cairo
+from packing import pack_rows
+from profiling import traced
+
+# number of rendered tiles kept in the atlas, enough to fill a large screen
+# a few times over at any preview scale
+ATLAS_TILES = 1024
+
+# widest atlas tile in pixels, cairo can't make surfaces wider than 32767
+# and a whole line of a big font at a high scale would be far wider
+TILE_WIDTH = 2048
+
+# bit order of cairo's 1 bit surfaces follows the machine
+A1_MSB_FIRST = sys.byteorder == "big"
+
+# longest time in seconds spent rendering atlas lines in one idle callback,
+# keeps the main loop responsive while the overview fills in
+RENDER_BUDGET = 0.008
 
 class FontViewWidget(Gtk.ScrolledWindow):
+  """ Overview of every character in the font.  Rather than one widget per
+      character the whole grid is a single drawing area, only the part
+      inside the visible part of the scrolled window is drawn from a cache
+      of pre-rendered tiles (the atlas).  A tile is a run of characters
+      from one line, at most TILE_WIDTH pixels wide.
+
+      Atlas tiles are 1 bit masks, the colours are applied when they're
+      drawn so changing colour doesn't re-render anything.  They're kept
+      per preview scale so switching back and forth is free too.
+
+      Tiles missing from the atlas are rendered from the GLib main loop a
+      few at a time, the visible ones first, so the window never waits for
+      the whole overview to be drawn. """
+  @traced("FontViewWidget.__init__")
   def __init__(self, font):
     GObject.GObject.__init__(self)
 
-    self.fg = (b"%c%c%c" % (font.fg['r'] >> 8, font.fg['g'] >> 8,
-                           font.fg['b'] >> 8))
-    self.bg = (b"%c%c%c" % (font.bg['r'] >> 8, font.bg['g'] >> 8,
-                           font.bg['b'] >> 8))
+    self.fg = (font.fg['r'] / 65535, font.fg['g'] / 65535,
+               font.fg['b'] / 65535)
+    self.bg = (font.bg['r'] / 65535, font.bg['g'] / 65535,
+               font.bg['b'] / 65535)
 
     try:
       self.mag = font.scale
@@ -43,90 +77,283 @@ class FontViewWidget(Gtk.ScrolledWindow):
       # old font save without the scale attribute
       self.mag = 1
 
-    self.highlight_colour = Gdk.Color(65535, 0, 0)
+    self.highlight_colour = (1.0, 0.0, 0.0)
+    self.match_colour = (0.0, 0.6, 1.0)
     tc = self.get_style_context().get_background_color(Gtk.StateFlags.NORMAL)
-    #print(tc)
-    #tc = tc.bg[Gtk.StateFlags.NORMAL]
-    self.normal_colour = Gdk.Color(tc.red, tc.green, tc.blue)
+    self.normal_colour = (tc.red, tc.green, tc.blue)
 
     self.font = font
-    self.chars_per_line = int(floor(sqrt(font.chars)))
+    self.chars_per_line = max(1, int(floor(sqrt(font.chars))))
     self.lines = int(ceil(font.chars / self.chars_per_line))
+    self.selected = None
+    # characters marked by a search, see set_matches
+    self.matches = set()
+    self.checkpoint = font.checkpoint()
+
+    # (scale, line number, tile number) -> 1 bit cairo surface, set where
+    # the pixels of that tile of characters are foreground
+    self.atlas = OrderedDict()
+    self.atlas_limit = ATLAS_TILES
+    # (line, tile) waiting to be rendered, most urgent first, and the idle
+    # source rendering them
+    self.pending = []
+    self.render_id = None
+    self.connect("destroy", self.destroy_cb)
 
-    self.table = Gtk.Table(self.lines, self.chars_per_line, True)
-
-    self.add_with_viewport(self.table)
-
-    self.pbf = []
-    self.img = []
-    self.img_border = []
-    for c in range(font.chars):
-      # generate a pixmap of the character and display it in the table
-      # first make a string from the font entry
-      d = b""
-      for i in range(font.rows):
-        for j in range(font.cols):
-          if font.get_character(c)[i][j]:
-            d += self.fg
-          else:
-            d += self.bg
-      # now make a new pixbuf from this
-      self.pbf.append(GdkPixbuf.Pixbuf.new_from_data(d, GdkPixbuf.Colorspace.RGB,
-                      False, 8, font.cols, font.rows, font.cols * 3).scale_simple(font.cols * self.mag, font.rows * self.mag, GdkPixbuf.InterpType.NEAREST))
-
-      row = c / self.chars_per_line
-      col = c % self.chars_per_line
-      self.img.append(Gtk.Image.new_from_pixbuf(self.pbf[c]))
-      self.img_border.append(Gtk.EventBox())
-      self.img_border[c].add(self.img[c])
-      self.img_border[c].connect("button-press-event", self.char_click, c)
-      self.img[c].set_padding(1,1)
-      self.table.attach(self.img_border[c], col, col+1, row, row+1)
+    self.drawing = Gtk.DrawingArea()
+    self.drawing.connect("draw", self.expose)
+    self.drawing.connect("button-press-event", self.char_click)
+    self.drawing.set_events(self.drawing.get_events()
+                            | Gdk.EventMask.BUTTON_PRESS_MASK)
+    self.add(self.drawing)
+    self.set_cell_size()
 
     self.show_all()
 
+  def set_cell_size(self):
+    # one pixel border round each character for the selection highlight
+    self.cell_width = self.font.cols * self.mag + 2
+    self.cell_height = self.font.rows * self.mag + 2
+    # characters across each atlas tile
+    self.tile_cols = max(1, TILE_WIDTH // self.cell_width)
+    self.drawing.set_size_request(self.cell_width * self.chars_per_line,
+                                  self.cell_height * self.lines)
+
+  def glyph_mask(self, c):
+    """ Character c as a 1 bit cairo surface at 1:1 """
+    cols = self.font.cols
+    stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_A1, cols)
+    data = bytearray(pack_rows(self.font.get_packed(c), cols,
+                               msb_first=A1_MSB_FIRST, stride=stride))
+    return cairo.ImageSurface.create_for_data(data, cairo.FORMAT_A1, cols,
+                                              self.font.rows, stride)
+
+  def draw_glyph(self, context, c):
+    """ Draw character c into its place on an atlas tile, replacing
+        whatever was there """
+    x = (c % self.chars_per_line % self.tile_cols) * self.cell_width + 1
+    context.save()
+    context.rectangle(x, 1, self.cell_width - 2, self.cell_height - 2)
+    context.clip()
+    context.set_operator(cairo.OPERATOR_SOURCE)
+    context.translate(x, 1)
+    context.scale(self.mag, self.mag)
+    context.set_source_surface(self.glyph_mask(c), 0, 0)
+    context.get_source().set_filter(cairo.FILTER_NEAREST)
+    context.paint()
+    context.restore()
+
+  def tile_columns(self, tile):
+    """ The first and end column of an atlas tile """
+    start = tile * self.tile_cols
+    return start, min(self.chars_per_line, start + self.tile_cols)
+
+  def atlas_tile(self, line, tile):
+    """ Fetch the rendered mask for one tile of a line of characters at the
+        current scale, rendering it if it's not in the atlas """
+    key = (self.mag, line, tile)
+    if key in self.atlas:
+      self.atlas.move_to_end(key)
+      return self.atlas[key]
+
+    start, end = self.tile_columns(tile)
+    surface = cairo.ImageSurface(cairo.FORMAT_A1,
+                                 self.cell_width * (end - start),
+                                 self.cell_height)
+    context = cairo.Context(surface)
+    first = line * self.chars_per_line
+    # a new surface is clear, blank characters needn't be drawn at all
+    for c in self.font.populated(first + start, first + end):
+      self.draw_glyph(context, c)
+
+    self.atlas[key] = surface
+    if len(self.atlas) > self.atlas_limit:
+      self.atlas.popitem(last=False)
+    return surface
+
+  def queue_tiles(self, tiles):
+    """ Render (line, tile) pairs into the atlas from the main loop, ahead
+        of anything already waiting """
+    tiles = [t for t in tiles if (self.mag,) + t not in self.atlas]
+    if not tiles:
+      return
+    queued = set(tiles)
+    self.pending = tiles + [t for t in self.pending if t not in queued]
+    if self.render_id is None:
+      self.render_id = GLib.idle_add(self.render_pending)
+
+  def render_pending(self):
+    """ Idle callback, renders pending tiles until the time budget runs
+        out """
+    start = time.perf_counter()
+    try:
+      while self.pending and (time.perf_counter() - start < RENDER_BUDGET):
+        line, tile = self.pending.pop(0)
+        if (self.mag, line, tile) not in self.atlas:
+          self.atlas_tile(line, tile)
+          first, end = self.tile_columns(tile)
+          self.drawing.queue_draw_area(first * self.cell_width,
+                                       line * self.cell_height,
+                                       (end - first) * self.cell_width,
+                                       self.cell_height)
+    except BaseException:
+      # the source is removed, let the next expose start another
+      self.pending = []
+      self.render_id = None
+      raise
+    if self.pending:
+      return True
+    self.render_id = None
+    return False
+
+  def destroy_cb(self, *kw):
+    if self.render_id is not None:
+      GLib.source_remove(self.render_id)
+      self.render_id = None
+
+  def expose(self, area, context):
+    x1, y1, x2, y2 = context.clip_extents()
+    first = max(0, int(y1 // self.cell_height))
+    last = min(self.lines, int(ceil(y2 / self.cell_height)))
+
+    context.set_source_rgb(*self.normal_colour)
+    context.paint()
+
+    first_col = max(0, int(x1 // self.cell_width))
+    last_col = min(self.chars_per_line, int(ceil(x2 / self.cell_width)))
+    first_tile = first_col // self.tile_cols
+    last_tile = max(first_tile, int(ceil(last_col / self.tile_cols)))
+
+    missing = []
+    for line in range(first, last):
+      y = line * self.cell_height
+      # background of each character cell, then the foreground through the
+      # line's mask
+      end = min(last_col, self.font.chars - line * self.chars_per_line)
+      for col in range(first_col, end):
+        context.rectangle(col * self.cell_width + 1, y + 1,
+                          self.cell_width - 2, self.cell_height - 2)
+      context.set_source_rgb(*self.bg)
+      context.fill()
+
+      context.set_source_rgb(*self.fg)
+      for tile in range(first_tile, min(last_tile,
+                                        int(ceil(end / self.tile_cols)))):
+        key = (self.mag, line, tile)
+        if key not in self.atlas:
+          # filled in from the main loop
+          missing.append((line, tile))
+          continue
+        self.atlas.move_to_end(key)
+        x = tile * self.tile_cols * self.cell_width
+        context.mask_surface(self.atlas[key], x, y)
+
+    if missing:
+      # the visible tiles, then a screen's worth of lines either side ready
+      # for scrolling
+      span = last - first
+      tiles = range(first_tile, last_tile)
+      self.atlas_limit = max(ATLAS_TILES, 3 * span * len(tiles))
+      ahead = range(last, min(self.lines, last + span))
+      behind = range(first - 1, max(-1, first - 1 - span), -1)
+      near = [(line, tile) for line in list(ahead) + list(behind)
+              for tile in tiles]
+      self.queue_tiles(missing + near)
+
+    if self.matches:
+      context.set_source_rgb(*self.match_colour)
+      context.set_line_width(1)
+      for c in self.matches:
+        if first <= c // self.chars_per_line < last:
+          x, y = self.cell_origin(c)
+          context.rectangle(x + 0.5, y + 0.5, self.cell_width - 1,
+                            self.cell_height - 1)
+      context.stroke()
+
+    if self.selected is not None:
+      x, y = self.cell_origin(self.selected)
+      context.set_source_rgb(*self.highlight_colour)
+      context.set_line_width(1)
+      context.rectangle(x + 0.5, y + 0.5, self.cell_width - 1,
+                        self.cell_height - 1)
+      context.stroke()
+
+    return True
+
+  def cell_origin(self, c):
+    return ((c % self.chars_per_line) * self.cell_width,
+            (c // self.chars_per_line) * self.cell_height)
+
+  def queue_draw_char(self, c):
+    x, y = self.cell_origin(c)
+    self.drawing.queue_draw_area(x, y, self.cell_width, self.cell_height)
+
+  @traced()
   def update(self, c):
-    self.img_border[c].remove(self.img[c])
-    # generate a pixmap of the character and display it in the table
-    # first make a string from the font entry
-    d = b""
-    for i in range(self.font.rows):
-      for j in range(self.font.cols):
-        if self.font.get_character(c)[i][j]:
-          d += self.fg
-        else:
-          d += self.bg
-    # now make a new pixbuf from this
-    self.pbf[c] = GdkPixbuf.Pixbuf.new_from_data(d, GdkPixbuf.Colorspace.RGB,
-                  False, 8, self.font.cols, self.font.rows, self.font.cols * 3).scale_simple(self.font.cols * self.mag, self.font.rows * self.mag, GdkPixbuf.InterpType.NEAREST)
-    self.img[c] = Gtk.Image.new_from_pixbuf(self.pbf[c])
-    self.img[c].set_padding(1, 1)
-
-    row = c / self.chars_per_line
-    col = c % self.chars_per_line
-
-    self.img_border[c].add(self.img[c])
- 
+    """ Character c has changed in the font, redraw it """
+    line = c // self.chars_per_line
+    tile = c % self.chars_per_line // self.tile_cols
+    for key in list(self.atlas):
+      if key[1] == line:
+        if key[0] != self.mag:
+          # other scales are rendered again if they're needed
+          del self.atlas[key]
+        elif key[2] == tile:
+          self.draw_glyph(cairo.Context(self.atlas[key]), c)
+    self.queue_draw_char(c)
+
+  def refresh(self):
+    """ Redraw every character modified in the font since the last
+        refresh """
+    modified = self.font.modified_since(self.checkpoint)
+    if len(modified) < self.chars_per_line:
+      for c in modified:
+        self.update(c)
+    else:
+      # after a change to many characters (a transform of the whole font)
+      # the lines they're on are rendered again instead
+      lines = {c // self.chars_per_line for c in modified}
+      for key in list(self.atlas):
+        if key[1] in lines:
+          del self.atlas[key]
+      self.drawing.queue_draw()
+    self.checkpoint = self.font.checkpoint()
+
   def select(self, c):
-    for i in range(self.font.chars):
-      if i == c:
-        self.img_border[c].modify_bg(Gtk.StateType.NORMAL, self.highlight_colour)
-      else:
-        self.img_border[i].modify_bg(Gtk.StateType.NORMAL, self.normal_colour)
-    
-  def char_click(self, widget, event, ind):
-    self.emit("select-char", ind)
+    if self.selected is not None:
+      self.queue_draw_char(self.selected)
+    self.selected = c
+    self.queue_draw_char(c)
+
+  def set_matches(self, chars):
+    """ Outline chars, e.g. the results of a search, replacing any already
+        outlined """
+    for c in self.matches:
+      self.queue_draw_char(c)
+    self.matches = set(chars)
+    for c in self.matches:
+      self.queue_draw_char(c)
+
+  def char_click(self, widget, event):
+    col = int(event.x // self.cell_width)
+    ind = int(event.y // self.cell_height) * self.chars_per_line + col
+    if (0 <= col < self.chars_per_line) and (0 <= ind < self.font.chars):
+      self.emit("select-char", ind)
  
+  @traced()
   def set_colours(self, fr, fg, fb, br, bg, bb):
-    self.fg = b"%c%c%c" % (fr >> 8, fg >> 8, fb >> 8)
-    self.bg = b"%c%c%c" % (br >> 8, bg >> 8, bb >> 8)
-    for c in range(self.font.chars):
-      self.update(c)
+    # the atlas holds no colour, just draw it again
+    self.fg = (fr / 65535, fg / 65535, fb / 65535)
+    self.bg = (br / 65535, bg / 65535, bb / 65535)
+    self.drawing.queue_draw()
   
   def set_scale(self, scale):
+    if scale == self.mag:
+      return
     self.mag = scale
-    for c in range(self.font.chars):
-      self.update(c)
+    self.pending = []
+    self.set_cell_size()
+    self.drawing.queue_draw()
 
 # make the new signal select-char generated when a character image is clicked
 GObject.signal_new("select-char", FontViewWidget,